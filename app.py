@@ -1,9 +1,29 @@
-import numpy as np
+import time
+
 import pandas as pd
 import streamlit as st
-from sklearn.datasets import fetch_openml
 
+from src.backend import PandasBackend, open_parquet, parquet_datasets
+from src.bitmap import build_index
+from src.cache import RESULT_CACHE, share_frame
+from src.compact import compact
+from src.cube import CubeBackend, attach_cube, build_cube, get_cube
+from src.fingerprint import attach_fingerprint, derive_fingerprint, get_fingerprint
+from src.live import (
+    LIVE_DIR,
+    LIVE_INTERVAL,
+    LIVE_TIME_UNITS,
+    CsvFeed,
+    LiveBar,
+    LiveDonut,
+    LiveHistogram,
+    LiveTimeSeries,
+    LiveWindow,
+    live_datasets,
+)
+from src.metrics import METRICS_ENABLED, run_records, start_run, write_metrics
 from src.plots import (
+    chart_group,
     plot_2d_histo,
     plot_bar,
     plot_box,
@@ -15,6 +35,16 @@ from src.plots import (
     plot_series_heatmap,
     plot_timeseries,
 )
+from src.profiler import parse_datetimes, profile_columns
+from src.store import load_dataset, read_dataset, read_manifest, share_dataset
+from src.upload import (
+    UPLOAD_DIR,
+    UPLOAD_TYPES,
+    file_digest,
+    upload_name,
+    uploaded_datasets,
+    write_upload,
+)
 
 DATASET_LIST = ["titanic", "iris", "diabetes", "wine", "sonar"]
 TIME_SCALES = [
@@ -30,17 +60,124 @@ TIME_SCALES = [
     "yearmonthdate",
 ]
 MSG_SELECT_VALUE_X = "Please select a value for X."
+PREVIEW_MAX_ROWS = 10_000
+# Prepared datasets kept in memory by the app, shared by every session
+PREPARED_MAX_DATASETS = 16
+# Views whose charts a cube can answer
+CUBE_VIEWS = ["Bar", "Donut Simple", "Donut Complex"]
+VIEWS = [
+    "Bar",
+    "Histogram",
+    "Time Series",
+    "Boxplot",
+    "Scatter",
+    "Donut Simple",
+    "Donut Complex",
+    "Line",
+]
+# Session state keys of the selected view, of the dataset the chart options were
+# chosen for, and default values of the chart options (set here, not by the widgets)
+STATE_VIEW = "view"
+LIVE_VIEWS = ["Bar", "Histogram", "Time Series", "Donut", "Scatter", "Line"]
+STATE_DATASET = "view_dataset"
+VIEW_DEFAULTS = {"histo_bins": 10, "box_zero": True}
 
 
-@st.experimental_memo
-def get_data(name):
-    return fetch_openml(
-        name=name,
-        version=1,
-        as_frame=True,
-        target_column=None,
-        return_X_y=True,
-    )
+def get_data(name, uploaded=False):
+    return read_dataset(name, UPLOAD_DIR) if uploaded else load_dataset(name)
+
+
+@st.experimental_singleton(max_entries=PREPARED_MAX_DATASETS)
+def prepare_data(name, uploaded=False, version=None):
+    # Shared by every session and rerun: the returned frame is memory-mapped, read-only.
+    # Uploads are also keyed on the hash of their file (version), so a file uploaded
+    # again under the same name gets its own entry, the previous one is evicted once
+    # it is the least recently used
+    df = get_data(name, uploaded)
+
+    # Add synthetic datetime column (new column block, the frame is not copied)
+    if not uploaded:
+        dates = pd.date_range(start="2000-01-01", end="2022-01-01", periods=len(df))
+        df["date"] = dates.floor("s")
+
+    # Single pass per column: kind, distinct values and datetime format of strings
+    types = profile_columns(df)
+    parse_datetimes(df, types)
+    memory = compact(df, cat_cols=types["cat"])
+    df = share_dataset(name, df)
+
+    # Identifies this version of the dataset, used as cache key instead of hashing df
+    manifest = read_manifest(name, UPLOAD_DIR) if uploaded else read_manifest(name)
+    attach_fingerprint(df, source=manifest)
+    share_frame(df)
+    # Counts and sums per combination of categories, for bars and donuts
+    cube = build_cube(df, types)
+    if cube is not None:
+        attach_cube(df, cube)
+    # Rows of each category, for the filters
+    index = build_index(df, types)
+    return df, types, memory, index
+
+
+@st.experimental_singleton
+def prepare_parquet(name):
+    # Queried in place by DuckDB, charts only ever load aggregated results
+    backend = open_parquet(name)
+    return backend, profile_columns(backend), None, None
+
+
+def filter_backend(df, index, selection, filters, view):
+    # Bars and donuts are read from the cells of the dataset cube with the selected
+    # values when it holds every filtered column (no row is read), other charts from
+    # the selected rows, gathered by each aggregation and never kept
+    fingerprint = derive_fingerprint(get_fingerprint(df), filters)
+    cube = get_cube(df)
+    if view in CUBE_VIEWS and cube is not None and cube.covers_filters(dict(filters)):
+        return CubeBackend(cube.select(dict(filters)), fingerprint)
+    return PandasBackend(df, index.rows(selection), fingerprint)
+
+
+def upload_dataset(file):
+    # Converted once per uploaded file, later reruns find it in the store
+    name = upload_name(file.name)
+    manifest = read_manifest(name, UPLOAD_DIR)
+    if manifest and manifest.get("file_digest") == file_digest(file, file.size):
+        return name
+
+    progress = st.progress(0.0)
+    write_upload(file.name, file, file.size, progress=progress.progress)
+    progress.empty()
+    return name
+
+
+def upload_version(name):
+    return (read_manifest(name, UPLOAD_DIR) or {}).get("file_digest")
+
+
+def filter_sidebar(index):
+    # Global filters, applied to every view: (column, selected values) pairs
+    filters = []
+    with st.sidebar:
+        st.subheader("Filters")
+        for col, values in index.values.items():
+            if selected := st.multiselect(label=col, options=values, key=f"filter_{col}"):
+                filters.append((col, tuple(selected)))
+    return tuple(filters)
+
+
+def keep_view_state(dataset):
+    # Widgets of hidden views are not rendered, so Streamlit would forget their values:
+    # they are kept by copying them to the session state at every run, and reset (but
+    # the selected view) when the dataset changes, as their options do too
+    if st.session_state.get(STATE_DATASET) != dataset:
+        for key in list(st.session_state):
+            if key != STATE_VIEW:
+                del st.session_state[key]
+        st.session_state[STATE_DATASET] = dataset
+    for key, value in VIEW_DEFAULTS.items():
+        st.session_state.setdefault(key, value)
+    for key in list(st.session_state):
+        st.session_state[key] = st.session_state[key]
 
 
 def generate_select_boxes(options_x, options_y, options_color, key_prefix):
@@ -72,60 +209,151 @@ def generate_select_boxes(options_x, options_y, options_color, key_prefix):
     return select_boxes
 
 
+def live_chart(view, types, numeric):
+    # Running aggregate (or window of rows) of the selected live view, None until its
+    # required columns are selected
+    cat_cols, datetime_cols = types["cat"], types["datetime"]
+    if view == "Bar":
+        col_x, col_y, col_color = generate_select_boxes(
+            cat_cols, numeric, cat_cols, key_prefix="live_bar"
+        )
+        return LiveBar(col_x, col_y, col_color) if col_x else None
+    if view == "Histogram":
+        col_x, _, col_color = generate_select_boxes(
+            numeric, None, cat_cols, key_prefix="live_histo"
+        )
+        return LiveHistogram(col_x, col_color) if col_x else None
+    if view == "Time Series":
+        col_x, col_y, col_color = generate_select_boxes(
+            datetime_cols, numeric, cat_cols, key_prefix="live_series"
+        )
+        unit = st.selectbox(
+            label="Time scale", options=list(LIVE_TIME_UNITS), key="live_series_unit"
+        )
+        return LiveTimeSeries(col_x, unit, col_y, col_color) if col_x else None
+    if view == "Donut":
+        _, _, col_color = generate_select_boxes(
+            None, None, cat_cols, key_prefix="live_donut"
+        )
+        return LiveDonut(col_color) if col_color else None
+
+    col_x, col_y, col_color = generate_select_boxes(
+        numeric, numeric, cat_cols, key_prefix=f"live_{view.lower()}"
+    )
+    mark = "line" if view == "Line" else "circle"
+    return LiveWindow(mark, col_x, col_y, col_color) if col_x and col_y else None
+
+
+def show_live(name):
+    # Tails the feed until the next rerun: new rows update the running aggregates of
+    # the chart, and only their delta is sent to the browser
+    feed = CsvFeed(LIVE_DIR / name)
+    batch = feed.read()
+    if batch.empty:
+        st.info("Waiting for the first rows of the feed.")
+        time.sleep(LIVE_INTERVAL)
+        st.experimental_rerun()
+
+    types = profile_columns(batch)
+    parse_datetimes(batch, types)
+    numeric = list(batch.select_dtypes("number").columns)
+    view = st.radio(label="Chart", options=LIVE_VIEWS, horizontal=True, key="live_view")
+    chart = live_chart(view, types, numeric)
+    if chart is None:
+        st.warning("Please select the columns of the chart.")
+        return
+
+    chart.update(batch)
+    placeholder, status = st.empty(), st.empty()
+    element = placeholder.vega_lite_chart(chart.table(), chart.spec())
+    while True:
+        # Each message to the browser is also where Streamlit stops the loop on rerun
+        status.caption(f"{feed.n_rows:,} rows, refreshed every {LIVE_INTERVAL:g}s")
+        time.sleep(LIVE_INTERVAL)
+        batch = feed.read()
+        if batch.empty:
+            continue
+        parse_datetimes(batch, types)
+        delta = chart.update(batch)
+        if delta is None:
+            element = placeholder.vega_lite_chart(chart.table(), chart.spec())
+        else:
+            element.add_rows(delta)
+
+
 if __name__ == "__main__":
     st.header("Streamlit Vega Lite Charts")
     st.caption(
         "Generate insightful charts from tabular data using Vega-Lite and Streamlit."
     )
 
-    if name := st.selectbox(label="Select a dataset", options=[""] + DATASET_LIST):
-        # Load data + add synthetic datetime column
-        df, _ = get_data(name)
-        time = pd.DataFrame(
-            {
-                "date": pd.date_range(
-                    start="2000-01-01",
-                    end="2022-01-01",
-                    periods=len(df),
-                )
-            }
-        )
-        df = pd.concat([df, time], axis=1)
+    with st.expander(label="Upload custom dataset"):
+        file = st.file_uploader(label="CSV or Parquet file", type=UPLOAD_TYPES)
+        if file:
+            try:
+                st.caption(f"Uploaded as {upload_dataset(file)}")
+            except ValueError as error:
+                st.error(error)
+
+    parquet_list, upload_list = parquet_datasets(), uploaded_datasets()
+    live_list = live_datasets()
+    options = [""] + DATASET_LIST + upload_list + parquet_list + live_list
+    if name := st.selectbox(label="Select a dataset", options=options):
+        start_run(dataset=name)
+        if name in live_list:
+            show_live(name)
+            st.stop()
+
+        # Load data + segment columns by types (computed once per dataset)
+        uploaded = name in upload_list
+        try:
+            if name in parquet_list:
+                df, types, memory, index = prepare_parquet(name)
+            else:
+                version = upload_version(name) if uploaded else None
+                df, types, memory, index = prepare_data(name, uploaded, version)
+        except FileNotFoundError as error:
+            st.error(error)
+            st.stop()
+        cont_cols, cat_cols, datetime_cols = types["num"], types["cat"], types["datetime"]
+        keep_view_state(name)
+
+        # Filters of in-memory datasets, by bitmap index
+        n_rows = n_selected = len(df)
+        preview = df.head(PREVIEW_MAX_ROWS)
+        filters = filter_sidebar(index) if index is not None else ()
+        if filters:
+            selection = index.select(dict(filters))
+            n_selected = index.count(selection)
+            if not n_selected:
+                st.warning("No rows match the filters.")
+                st.stop()
+            preview = df.take(index.rows(selection)[:PREVIEW_MAX_ROWS])
 
         # Dataframe overview
-        st.dataframe(df)
+        st.dataframe(preview)
+        if n_selected > PREVIEW_MAX_ROWS:
+            st.caption(f"Showing the first {PREVIEW_MAX_ROWS:,} of {n_selected:,} rows.")
+        if n_selected < n_rows:
+            st.caption(f"Filtered: {n_selected:,} of {n_rows:,} rows.")
+        if memory:
+            st.caption(
+                f"Memory footprint: {memory['before'] / 1e6:.2f} MB "
+                f"(compacted to {memory['after'] / 1e6:.2f} MB)"
+            )
 
-        # Segment columns by types
-        datetime_cols = list(df.select_dtypes(include=[np.datetime64]).columns.values)
-        num_cols = list(df.select_dtypes(include=[np.number]).columns.values)
-        cont_cols = [col for col in num_cols if df[col].nunique() > 20]
-        cat_cols = [col for col in df.columns if col not in cont_cols + datetime_cols]
         with st.expander(label="Detected types"):
-            st.json({"num": cont_cols, "cat": cat_cols, "datetime": datetime_cols})
+            st.json(types)
 
         # Plot
-        (
-            tab_bar,
-            tab_histo,
-            tab_timeseries,
-            tab_boxplot,
-            tab_scatter,
-            tab_donut_simple,
-            tab_donut_complex,
-            tab_line,
-        ) = st.tabs(
-            [
-                "Bar",
-                "Histogram",
-                "Time Series",
-                "Boxplot",
-                "Scatter",
-                "Donut Simple",
-                "Donut Complex",
-                "Line",
-            ]
-        )
-        with tab_bar:
+        # Only the selected view runs (st.tabs would run all of them at every rerun),
+        # the charts of other views stay in the result cache
+        view = st.radio(label="Chart", options=VIEWS, horizontal=True, key=STATE_VIEW)
+
+        if filters:
+            df = filter_backend(df, index, selection, filters, view)
+
+        if view == "Bar":
             col_x, col_y, col_color = generate_select_boxes(
                 options_x=cat_cols,
                 options_y=cont_cols,
@@ -142,11 +370,9 @@ if __name__ == "__main__":
                 st.subheader("Mean bar plot")
                 plot_bar(df, col_x=col_x, col_y=col_y, agg="mean")
             elif not col_y and col_color:
-                st.subheader("Stacked bar")
-                plot_bar(df, col_x=col_x, col_color=col_color, agg="count")
-
-                st.subheader("Normed bar")
-                plot_bar(df, col_x=col_x, col_color=col_color, agg="count", norm=True)
+                with chart_group(["Stacked bar", "Normed bar"]):
+                    plot_bar(df, col_x=col_x, col_color=col_color, agg="count")
+                    plot_bar(df, col_x=col_x, col_color=col_color, agg="count", norm=True)
             else:
                 st.subheader("Grouped bar")
                 plot_bar(
@@ -158,20 +384,20 @@ if __name__ == "__main__":
                     group=True,
                 )
 
-        with tab_histo:
+        elif view == "Histogram":
             col_x, col_y, col_color = generate_select_boxes(
                 options_x=cont_cols,
                 options_y=cont_cols + cat_cols,
                 options_color=cat_cols,
                 key_prefix="histo",
             )
-            bins = st.slider(label="Bins", min_value=1, max_value=100, value=10)
-            ordinal = st.checkbox(label="Ordinal", value=False)
+            bins = st.slider(label="Bins", min_value=1, max_value=100, key="histo_bins")
+            ordinal = st.checkbox(label="Ordinal", key="histo_ordinal")
 
             if not col_x:
                 st.warning(MSG_SELECT_VALUE_X)
             elif not col_y and not col_color:
-                normalize = st.checkbox(label="Normalize", value=False)
+                normalize = st.checkbox(label="Normalize", key="histo_normalize")
 
                 if ordinal and normalize:
                     st.warning("Please select only one (Ordinal or Normalize)")
@@ -185,58 +411,61 @@ if __name__ == "__main__":
                         normalize=normalize,
                     )
             elif col_y and not col_color:
-                st.subheader("2D scatter histogram")
-                plot_2d_histo(
-                    df,
-                    mark="circle",
-                    col_x=col_x,
-                    col_y=col_y,
-                    bin_x=bins,
-                    bin_y=bins,
-                    ordinal=ordinal,
-                )
-
-                st.subheader("2D heatmap histogram")
-                plot_2d_histo(
-                    df,
-                    mark="rect",
-                    col_x=col_x,
-                    col_y=col_y,
-                    bin_x=bins,
-                    bin_y=bins,
-                    ordinal=ordinal,
-                )
+                with chart_group(["2D scatter histogram", "2D heatmap histogram"]):
+                    plot_2d_histo(
+                        df,
+                        mark="circle",
+                        col_x=col_x,
+                        col_y=col_y,
+                        bin_x=bins,
+                        bin_y=bins,
+                        ordinal=ordinal,
+                    )
+                    plot_2d_histo(
+                        df,
+                        mark="rect",
+                        col_x=col_x,
+                        col_y=col_y,
+                        bin_x=bins,
+                        bin_y=bins,
+                        ordinal=ordinal,
+                    )
             elif not col_y and col_color:
-                st.subheader("Stacked histogram")
-                plot_histo(
-                    df,
-                    col_x=col_x,
-                    col_color=col_color,
-                    bin=bins,
-                    ordinal=ordinal,
-                )
-
-                st.subheader("Layered histogram")
-                plot_histo(
-                    df,
-                    col_x=col_x,
-                    col_color=col_color,
-                    bin=bins,
-                    layered=True,
-                    ordinal=ordinal,
-                )
+                with chart_group(["Stacked histogram", "Layered histogram"]):
+                    plot_histo(
+                        df,
+                        col_x=col_x,
+                        col_color=col_color,
+                        bin=bins,
+                        ordinal=ordinal,
+                    )
+                    plot_histo(
+                        df,
+                        col_x=col_x,
+                        col_color=col_color,
+                        bin=bins,
+                        layered=True,
+                        ordinal=ordinal,
+                    )
             else:
                 st.warning("You cannot select Y and Color at the same time.")
 
-        with tab_timeseries:
+        elif view == "Time Series":
             col_x, col_y, col_color = generate_select_boxes(
                 options_x=datetime_cols,
                 options_y=cont_cols,
                 options_color=cat_cols,
                 key_prefix="series",
             )
-            units = st.selectbox(label="Time scale", options=TIME_SCALES)
-            mark = st.radio(label="Mark type", options=["line", "bar"], horizontal=True)
+            units = st.selectbox(
+                label="Time scale", options=TIME_SCALES, key="series_unit"
+            )
+            mark = st.radio(
+                label="Mark type",
+                options=["line", "bar"],
+                horizontal=True,
+                key="series_mark",
+            )
             if not col_x:
                 st.warning(MSG_SELECT_VALUE_X)
             elif not col_y:
@@ -250,29 +479,20 @@ if __name__ == "__main__":
                     agg="count",
                 )
             else:
-                st.header("Aggregated series plot")
-                agg = st.selectbox(
+                column_series, column_heatmap = st.columns(2)
+                agg = column_series.selectbox(
                     label="Aggregation method",
                     options=["mean", "median", "max", "min"],
                     key="agg_time_series",
                 )
-                plot_timeseries(
-                    df,
-                    mark=mark,
-                    unit=units,
-                    col_x=col_x,
-                    col_y=col_y,
-                    col_color=col_color,
-                    agg=agg,
-                )
-                st.header("Heatmap series plot")
-                agg_heat = st.selectbox(
-                    label="Aggregation method",
+                agg_heat = column_heatmap.selectbox(
+                    label="Heatmap aggregation method",
                     options=["mean", "median", "max", "min"],
                     key="agg_time_series_heat",
                 )
-                ht_scale = st.selectbox(
+                ht_scale = column_heatmap.selectbox(
                     label="Heatmap time scale",
+                    key="series_heat_scale",
                     options=["Month v/s Day", "Day v/s Hour", "Month v/s Year"],
                 )
                 ht_units = {
@@ -280,24 +500,34 @@ if __name__ == "__main__":
                     "Day v/s Hour": ["hours", "date"],
                     "Month v/s Year": ["year", "month"],
                 }
-                plot_series_heatmap(
-                    df,
-                    col_date=col_x,
-                    col_color=col_y,
-                    unit_x=ht_units[ht_scale][0],
-                    unit_y=ht_units[ht_scale][1],
-                    agg=agg_heat,
-                )
+                with chart_group(["Aggregated series plot", "Heatmap series plot"]):
+                    plot_timeseries(
+                        df,
+                        mark=mark,
+                        unit=units,
+                        col_x=col_x,
+                        col_y=col_y,
+                        col_color=col_color,
+                        agg=agg,
+                    )
+                    plot_series_heatmap(
+                        df,
+                        col_date=col_x,
+                        col_color=col_y,
+                        unit_x=ht_units[ht_scale][0],
+                        unit_y=ht_units[ht_scale][1],
+                        agg=agg_heat,
+                    )
 
-        with tab_boxplot:
+        elif view == "Boxplot":
             col_x, col_y, _ = generate_select_boxes(
                 options_x=cat_cols,
                 options_y=cont_cols,
                 options_color=None,
                 key_prefix="box",
             )
-            zero = st.checkbox(label="Zero", value=True)
-            color = st.checkbox(label="Color", value=False)
+            zero = st.checkbox(label="Zero", key="box_zero")
+            color = st.checkbox(label="Color", key="box_colored")
 
             if col_y:
                 st.header("Box plot")
@@ -311,7 +541,7 @@ if __name__ == "__main__":
             else:
                 st.warning("Please select a value for Y.")
 
-        with tab_scatter:
+        elif view == "Scatter":
             col_x, col_y, col_color = generate_select_boxes(
                 options_x=cont_cols,
                 options_y=cont_cols,
@@ -322,6 +552,7 @@ if __name__ == "__main__":
                 label="Mark type",
                 options=["point", "circle"],
                 horizontal=True,
+                key="scatter_mark",
             )
             if col_x and col_y:
                 st.header("Scatter plot")
@@ -329,7 +560,7 @@ if __name__ == "__main__":
             else:
                 st.warning("Please select values for both X and Y.")
 
-        with tab_donut_simple:
+        elif view == "Donut Simple":
             _, _, col_color = generate_select_boxes(
                 options_x=None,
                 options_y=None,
@@ -341,7 +572,7 @@ if __name__ == "__main__":
             else:
                 st.warning("Please select a value for Color.")
 
-        with tab_donut_complex:
+        elif view == "Donut Complex":
             _, _, col_color = generate_select_boxes(
                 options_x=None,
                 options_y=None,
@@ -358,7 +589,7 @@ if __name__ == "__main__":
             else:
                 st.warning("Please select a value for both Colors.")
 
-        with tab_line:
+        elif view == "Line":
             col_x, col_y, col_color = generate_select_boxes(
                 options_x=cont_cols + datetime_cols,
                 options_y=cont_cols + datetime_cols,
@@ -369,3 +600,12 @@ if __name__ == "__main__":
                 plot_line(df, col_x, col_y, col_color)
             else:
                 st.warning("Please select values for both X and Y.")
+
+        # Debug panel: timings and payloads of the charts of this run
+        if METRICS_ENABLED:
+            write_metrics()
+            with st.sidebar:
+                st.subheader("Chart metrics")
+                st.dataframe(pd.DataFrame(run_records()))
+                st.caption("Result cache")
+                st.json(RESULT_CACHE.stats())
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+FIELD_AGG = "_agg"
+
+# Whiskers extent in IQR units, default of the Vega-Lite boxplot mark
+BOX_EXTENT = 1.5
+QUARTILES = [0.25, 0.5, 0.75]
+FIELD_BOX_LOWER = "_lower"
+FIELD_BOX_Q1 = "_q1"
+FIELD_BOX_MEDIAN = "_median"
+FIELD_BOX_Q3 = "_q3"
+FIELD_BOX_UPPER = "_upper"
+# Outliers sent by box plots, the most extreme ones first (the furthest from a fence)
+BOX_MAX_OUTLIERS = 10_000
+
+
+def agg_title(agg, field=None):
+    # Mirror the default axis titles generated by Vega-Lite for aggregated fields
+    return "Count of Records" if agg == "count" else f"{agg.capitalize()} of {field}"
+
+
+def aggregate_bar(df, col_x, col_y=None, col_color=None, agg="count", norm=False):
+    keys = list(dict.fromkeys(col for col in (col_x, col_color) if col))
+    grouped = df.groupby(keys, observed=True, dropna=False, sort=False)
+    table = grouped.size() if agg == "count" else grouped[col_y].agg(agg)
+    table = table.rename(FIELD_AGG).reset_index()
+    return normalize_bar(table, col_x) if norm else table
+
+
+def normalize_bar(table, col_x):
+    total = table.groupby(col_x, observed=True, dropna=False)[FIELD_AGG]
+    table[FIELD_AGG] = table[FIELD_AGG] / total.transform("sum")
+    return table
+
+
+def box_stats(df, col_x, col_y, col_color=None, max_outliers=BOX_MAX_OUTLIERS):
+    # Tukey box plot statistics (as in the Vega-Lite boxplot mark) + outlier rows only
+    keys = list(dict.fromkeys(col for col in (col_x, col_color) if col))
+    frame = df[keys + [col_y]].dropna(subset=[col_y])
+    codes = (
+        frame.groupby(keys, observed=True, dropna=False, sort=False).ngroup().to_numpy()
+        if keys
+        else np.zeros(len(frame), dtype=np.int64)
+    )
+    values = frame[col_y].to_numpy(dtype=float)
+    _, first = np.unique(codes, return_index=True)
+
+    quartiles = pd.Series(values).groupby(codes).quantile(QUARTILES)
+    quartiles = quartiles.unstack().to_numpy().reshape(len(first), len(QUARTILES))
+
+    q1, q3 = quartiles[:, 0], quartiles[:, 2]
+    fence_low, fence_high = q1 - BOX_EXTENT * (q3 - q1), q3 + BOX_EXTENT * (q3 - q1)
+    distance = np.maximum(fence_low[codes] - values, values - fence_high[codes])
+    inside = distance <= 0
+    whiskers = pd.Series(values[inside]).groupby(codes[inside]).agg(["min", "max"])
+    whiskers = whiskers.reindex(range(len(first)))
+
+    summary = frame[keys].iloc[first].reset_index(drop=True)
+    summary[FIELD_BOX_LOWER] = whiskers["min"].to_numpy()
+    summary[FIELD_BOX_Q1] = q1
+    summary[FIELD_BOX_MEDIAN] = quartiles[:, 1]
+    summary[FIELD_BOX_Q3] = q3
+    summary[FIELD_BOX_UPPER] = whiskers["max"].to_numpy()
+
+    outliers = np.flatnonzero(~inside)
+    if len(outliers) > max_outliers:
+        extreme = np.argpartition(-distance[outliers], max_outliers - 1)
+        outliers = np.sort(outliers[extreme[:max_outliers]])
+    return pd.concat([summary, frame.iloc[outliers]], ignore_index=True)
+
+
+def donut_counts(df, col_color_1, col_color_2=None):
+    # Contingency table of the donut charts: one row per (color_1, color_2) pair
+    keys = list(dict.fromkeys(col for col in (col_color_1, col_color_2) if col))
+    grouped = df.groupby(keys, observed=True, dropna=False, sort=False)
+    table = grouped.size().rename("groupcount2").reset_index()
+    return donut_shares(table, col_color_1)
+
+
+def donut_shares(table, col_color_1):
+    # Completes a table of counts per (color_1, color_2) pair ("groupcount2")
+    total = table["groupcount2"].sum()
+
+    groupcount = table.groupby(col_color_1, observed=True, dropna=False)["groupcount2"]
+    table["groupcount"] = groupcount.transform("sum")
+    table["total"] = total
+    table["share"] = table["groupcount"] / total
+    table["share2"] = table["groupcount2"] / total
+    return table
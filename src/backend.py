@@ -0,0 +1,439 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.aggregations import (
+    BOX_EXTENT,
+    BOX_MAX_OUTLIERS,
+    FIELD_AGG,
+    FIELD_BOX_LOWER,
+    FIELD_BOX_MEDIAN,
+    FIELD_BOX_Q1,
+    FIELD_BOX_Q3,
+    FIELD_BOX_UPPER,
+    QUARTILES,
+    aggregate_bar,
+    box_stats,
+    donut_counts,
+    donut_shares,
+    normalize_bar,
+)
+from src.binning import (
+    FIELD_COUNT,
+    FIELDS_BIN_X,
+    FIELDS_BIN_Y,
+    bin_columns,
+    histogram,
+    histogram_2d,
+    histogram_table,
+    range_edges,
+)
+from src.cube import get_cube
+from src.fingerprint import fingerprint, get_fingerprint
+from src.metrics import timed
+from src.raster import RASTER_HEIGHT, RASTER_WIDTH, raster_table, rasterize
+from src.sampling import EXTREME_SHARE, SCATTER_MAX_POINTS, stratified_sample
+from src.store import STORE_DIR
+from src.timebuckets import AGGREGATIONS, field_agg, time_buckets, unit_parts
+
+# Parquet datasets (files, or directories of files) queried out-of-core with DuckDB
+PARQUET_DIR = Path(os.environ.get("VEGA_CHARTS_PARQUET_DIR", STORE_DIR / "parquet"))
+
+AGGREGATIONS_SQL = {
+    "count": "count",
+    "mean": "avg",
+    "median": "median",
+    "max": "max",
+    "min": "min",
+    "sum": "sum",
+}
+
+# Date parts of vega-time (weeks start on Sunday), see timebuckets.time_parts
+TIME_PARTS_SQL = {
+    "year": "year({})",
+    "quarter": "quarter({})",
+    "month": "month({})",
+    "week": "(dayofyear({0}) + 6 - dayofweek({0})) // 7",
+    "dayofyear": "dayofyear({})",
+    "day": "dayofweek({})",
+    "date": "day({})",
+    "hours": "hour({})",
+    "minutes": "minute({})",
+    "seconds": "second({})",
+    "milliseconds": "millisecond({}) % 1000",
+}
+
+
+class PandasBackend:
+    # In-memory frame, or the selected rows of one (positions given by the bitmap
+    # index), aggregated with the NumPy/pandas functions of each chart
+    def __init__(self, df, rows=None, fingerprint=None):
+        self.df, self.rows = df, rows
+        self.selection_fingerprint = fingerprint
+
+    @property
+    def in_memory(self):
+        # Selections only send aggregated results: their rows are gathered for each
+        # aggregation and never kept
+        return self.rows is None
+
+    def __len__(self):
+        return len(self.df) if self.rows is None else len(self.rows)
+
+    @property
+    def fingerprint(self):
+        if self.rows is None:
+            return get_fingerprint(self.df)
+        return self.selection_fingerprint
+
+    def frame(self, *cols):
+        # Only the columns of one aggregation, of the selected rows
+        if self.rows is None:
+            return self.df
+        columns = list(dict.fromkeys(col for col in cols if col))
+        return self.df[columns].take(self.rows).reset_index(drop=True)
+
+    def head(self, n):
+        return self.df.head(n) if self.rows is None else self.df.take(self.rows[:n])
+
+    def nunique(self, columns):
+        return {col: self.frame(col)[col].nunique() for col in columns}
+
+    @timed("aggregate")
+    def aggregate_bar(self, col_x, col_y=None, col_color=None, agg="count", norm=False):
+        df = self.frame(col_x, col_y, col_color)
+        cube = get_cube(df)
+        keys = list(dict.fromkeys(col for col in (col_x, col_color) if col))
+        if cube is not None and cube.covers(keys, col_y, agg):
+            return cube.aggregate_bar(col_x, col_y, col_color, agg, norm)
+        return aggregate_bar(df, col_x, col_y, col_color, agg, norm)
+
+    @timed("aggregate")
+    def histogram(self, col_x, col_color=None, maxbins=None, normalize=False):
+        df = self.frame(col_x, col_color)
+        return histogram(df, col_x, col_color, maxbins, normalize)
+
+    @timed("aggregate")
+    def histogram_2d(self, col_x, col_y, bin_x=None, bin_y=None):
+        return histogram_2d(self.frame(col_x, col_y), col_x, col_y, bin_x, bin_y)
+
+    @timed("aggregate")
+    def time_buckets(self, col_date, units, col_y=None, col_color=None):
+        df = self.frame(col_date, col_y, col_color)
+        return time_buckets(df, col_date, units, col_y, col_color)
+
+    @timed("aggregate")
+    def box_stats(self, col_x, col_y, col_color=None, approximate=False):
+        # Exact quartiles: the rows are in memory (approximate is for query backends)
+        df = self.frame(col_x, col_y, col_color)
+        return box_stats(df, col_x, col_y, col_color)
+
+    @timed("aggregate")
+    def donut_counts(self, col_color_1, col_color_2=None):
+        df = self.frame(col_color_1, col_color_2)
+        cube = get_cube(df)
+        keys = list(dict.fromkeys(col for col in (col_color_1, col_color_2) if col))
+        if cube is not None and cube.covers(keys):
+            return cube.donut_counts(col_color_1, col_color_2)
+        return donut_counts(df, col_color_1, col_color_2)
+
+    @timed("aggregate")
+    def sample(self, col_x, col_y, col_color=None, budget=SCATTER_MAX_POINTS, seed=0):
+        df = self.frame(col_x, col_y, col_color)
+        return stratified_sample(df, col_x, col_y, col_color, budget, seed)
+
+    @timed("aggregate")
+    def rasterize(
+        self, col_x, col_y, col_color=None, width=RASTER_WIDTH, height=RASTER_HEIGHT
+    ):
+        df = self.frame(col_x, col_y, col_color)
+        return rasterize(df, col_x, col_y, col_color, width=width, height=height)
+
+
+def ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def as_float(col):
+    return f"CAST({ident(col)} AS DOUBLE)"
+
+
+def is_valid(*cols):
+    # Neither null (isnan is null, so is the condition) nor NaN, as in pandas
+    return " AND ".join(f"NOT isnan({as_float(col)})" for col in cols)
+
+
+def keys_sql(*cols):
+    return [ident(col) for col in dict.fromkeys(col for col in cols if col)]
+
+
+def bin_index(col, edges):
+    # Same bins as numpy.histogram: the last bin includes its upper edge
+    start, step, n_bins = edges[0], edges[1] - edges[0], len(edges) - 1
+    index = f"CAST(floor(({as_float(col)} - {start!r}) / {step!r}) AS BIGINT)"
+    return f"least({index}, {n_bins - 1})"
+
+
+def cell_index(col, vmin, span, n_cells):
+    # Same pixels as raster.cell_index
+    index = f"CAST(floor(({as_float(col)} - {vmin!r}) / {span!r} * {n_cells}) AS BIGINT)"
+    return f"least({index}, {n_cells - 1})"
+
+
+class DuckDBBackend:
+    # Parquet dataset larger than memory: each chart aggregation is pushed down as a
+    # DuckDB query and only its (small) result is loaded in pandas
+    in_memory = False
+
+    def __init__(self, path):
+        # Imported here so that the pandas only app never needs it
+        import duckdb
+
+        path = Path(path)
+        self.files = sorted(path.rglob("*.parquet")) if path.is_dir() else [path]
+        if not self.files:
+            raise FileNotFoundError(f"No Parquet file found in {path}.")
+        self.connection = duckdb.connect()
+        self.source = f"read_parquet([{', '.join(literal(f) for f in self.files)}])"
+        self.n_rows = int(self.query(f"SELECT count(*) AS n FROM {self.source}")["n"][0])
+
+        # Files are identified by their size and modification time, never read
+        files = [(str(f), f.stat().st_size, f.stat().st_mtime_ns) for f in self.files]
+        self.fingerprint = fingerprint(
+            self.head(0), source={"files": files, "rows": self.n_rows}
+        )
+
+    def __len__(self):
+        return self.n_rows
+
+    def query(self, sql):
+        # One cursor per query, connections must not be shared between threads
+        return self.connection.cursor().execute(sql).df()
+
+    def head(self, n):
+        return self.query(f"SELECT * FROM {self.source} LIMIT {int(n)}")
+
+    def nunique(self, columns):
+        if not columns:
+            return {}
+        # HyperLogLog estimate, exact counts would need one hash table per column
+        counts = ", ".join(
+            f"approx_count_distinct({ident(col)}) AS {ident(col)}" for col in columns
+        )
+        row = self.query(f"SELECT {counts} FROM {self.source}").iloc[0]
+        return {col: int(row[col]) for col in columns}
+
+    def value_range(self, *cols):
+        bounds = ", ".join(
+            f"min({as_float(col)}) AS {ident(f'min_{i}')}, "
+            f"max({as_float(col)}) AS {ident(f'max_{i}')}"
+            for i, col in enumerate(cols)
+        )
+        row = self.query(f"SELECT {bounds} FROM {self.source} WHERE {is_valid(*cols)}")
+        row = row.iloc[0]
+        if pd.isna(row["min_0"]):
+            return None
+        return [(row[f"min_{i}"], row[f"max_{i}"]) for i in range(len(cols))]
+
+    @timed("aggregate")
+    def aggregate_bar(self, col_x, col_y=None, col_color=None, agg="count", norm=False):
+        keys = keys_sql(col_x, col_color)
+        value = (
+            "count(*)" if agg == "count" else f"{AGGREGATIONS_SQL[agg]}({ident(col_y)})"
+        )
+        table = self.query(
+            f"SELECT {', '.join(keys)}, {value} AS {ident(FIELD_AGG)} "
+            f"FROM {self.source} GROUP BY ALL"
+        )
+        return normalize_bar(table, col_x) if norm else table
+
+    @timed("aggregate")
+    def histogram(self, col_x, col_color=None, maxbins=None, normalize=False):
+        bounds = self.value_range(col_x)
+        if bounds is None:
+            columns = list(FIELDS_BIN_X) + [FIELD_COUNT]
+            return pd.DataFrame(columns=columns + ([col_color] if col_color else [])), 1
+
+        edges, step, precision = range_edges(*bounds[0], maxbins)
+        color = f", {ident(col_color)} AS _color" if col_color else ""
+        table = self.query(
+            f"SELECT {bin_index(col_x, edges)} AS _bin{color}, count(*) AS _count "
+            f"FROM {self.source} WHERE {is_valid(col_x)} GROUP BY ALL ORDER BY ALL"
+        )
+        colors = table["_color"].to_numpy() if col_color else None
+        idx_bin = table["_bin"].to_numpy()
+        counts = table["_count"].to_numpy()
+        table = histogram_table(
+            edges, precision, idx_bin, counts, col_color, colors, normalize
+        )
+        return table, step
+
+    @timed("aggregate")
+    def histogram_2d(self, col_x, col_y, bin_x=None, bin_y=None):
+        bounds = self.value_range(col_x, col_y)
+        if bounds is None:
+            columns = list(FIELDS_BIN_X) + list(FIELDS_BIN_Y) + [FIELD_COUNT]
+            return pd.DataFrame(columns=columns), 1, 1
+
+        edges_x, step_x, precision_x = range_edges(*bounds[0], bin_x)
+        edges_y, step_y, precision_y = range_edges(*bounds[1], bin_y)
+        table = self.query(
+            f"SELECT {bin_index(col_x, edges_x)} AS _bin_x, "
+            f"{bin_index(col_y, edges_y)} AS _bin_y, count(*) AS _count "
+            f"FROM {self.source} WHERE {is_valid(col_x, col_y)} GROUP BY ALL ORDER BY ALL"
+        )
+        idx_x, idx_y = table["_bin_x"].to_numpy(), table["_bin_y"].to_numpy()
+        table = pd.DataFrame(
+            {
+                **bin_columns(edges_x, precision_x, idx_x, FIELDS_BIN_X),
+                **bin_columns(edges_y, precision_y, idx_y, FIELDS_BIN_Y),
+                FIELD_COUNT: table["_count"].to_numpy().astype(np.int64),
+            }
+        )
+        return table, step_x, step_y
+
+    @timed("aggregate")
+    def time_buckets(self, col_date, units, col_y=None, col_color=None):
+        # Each bucket is represented by its earliest timestamp (see bucket_table)
+        date = ident(col_date)
+        parts = [TIME_PARTS_SQL[part].format(date) for part in unit_parts(*units)]
+        aggs = [f"min({date}) AS {date}", f"count(*) AS {ident(field_agg('count'))}"]
+        if col_y:
+            aggs += [
+                f"{AGGREGATIONS_SQL[agg]}({ident(col_y)}) AS {ident(field_agg(agg))}"
+                for agg in AGGREGATIONS[1:]
+            ]
+        keys = keys_sql(col_color)
+        return self.query(
+            f"SELECT {', '.join(keys + aggs)} FROM {self.source} "
+            f"WHERE {date} IS NOT NULL GROUP BY {', '.join(parts + keys)}"
+        )
+
+    @timed("aggregate")
+    def box_stats(self, col_x, col_y, col_color=None, approximate=False):
+        # Same statistics as aggregations.box_stats, keeping the most extreme outliers
+        keys = keys_sql(col_x, col_color)
+        quantile = "approx_quantile" if approximate else "quantile_cont"
+        join = " AND ".join(f"d.{key} IS NOT DISTINCT FROM q.{key}" for key in keys)
+        columns = "".join(f"{key}, " for key in keys)
+        fields = [FIELD_BOX_LOWER, FIELD_BOX_Q1, FIELD_BOX_MEDIAN, FIELD_BOX_Q3]
+        lower, q1, median, q3, upper = [ident(f) for f in fields + [FIELD_BOX_UPPER]]
+        query = f"""
+            WITH data AS (
+                SELECT {columns}{as_float(col_y)} AS _value
+                FROM {self.source} WHERE {is_valid(col_y)}
+            ),
+            quartiles AS (
+                SELECT *,
+                    _q[1] - {BOX_EXTENT} * (_q[3] - _q[1]) AS _low,
+                    _q[3] + {BOX_EXTENT} * (_q[3] - _q[1]) AS _high
+                FROM (
+                    SELECT {columns}{quantile}(_value, {QUARTILES}) AS _q
+                    FROM data GROUP BY ALL
+                )
+            ),
+            joined AS (
+                SELECT d.*, q._q,
+                    greatest(q._low - d._value, d._value - q._high) AS _distance
+                FROM data AS d JOIN quartiles AS q ON {join or 'TRUE'}
+            )
+        """
+        summary = self.query(
+            f"""{query}
+            SELECT {columns}
+                min(_value) FILTER (WHERE _distance <= 0) AS {lower},
+                any_value(_q[1]) AS {q1},
+                any_value(_q[2]) AS {median},
+                any_value(_q[3]) AS {q3},
+                max(_value) FILTER (WHERE _distance <= 0) AS {upper}
+            FROM joined GROUP BY ALL"""
+        )
+        outliers = self.query(
+            f"""{query}
+            SELECT {columns}_value AS {ident(col_y)} FROM joined
+            WHERE _distance > 0 ORDER BY _distance DESC LIMIT {BOX_MAX_OUTLIERS}"""
+        )
+        return pd.concat([summary, outliers], ignore_index=True)
+
+    @timed("aggregate")
+    def donut_counts(self, col_color_1, col_color_2=None):
+        keys = keys_sql(col_color_1, col_color_2)
+        table = self.query(
+            f"SELECT {', '.join(keys)}, count(*) AS groupcount2 "
+            f"FROM {self.source} GROUP BY ALL"
+        )
+        return donut_shares(table, col_color_1)
+
+    @timed("aggregate")
+    def sample(self, col_x, col_y, col_color=None, budget=SCATTER_MAX_POINTS, seed=0):
+        # Reservoir sample (colors keep their share on average) + extremes of each axis
+        columns = ", ".join(keys_sql(col_x, col_y, col_color))
+        rows = f"SELECT {columns} FROM {self.source} WHERE {is_valid(col_x, col_y)}"
+        n_total = int(self.query(f"SELECT count(*) AS n FROM ({rows})")["n"][0])
+        if n_total <= budget:
+            return self.query(rows), n_total
+
+        n_extremes = int(budget * EXTREME_SHARE / 4)
+        extremes = [
+            f"(SELECT * FROM ({rows}) ORDER BY {ident(col)} {order} LIMIT {n_extremes})"
+            for col in (col_x, col_y)
+            for order in ("ASC", "DESC")
+        ]
+        sample = (
+            f"(SELECT * FROM ({rows}) "
+            f"USING SAMPLE reservoir({budget - 4 * n_extremes} ROWS) REPEATABLE ({seed}))"
+        )
+        return self.query(" UNION ALL ".join(extremes + [sample])), n_total
+
+    @timed("aggregate")
+    def rasterize(
+        self, col_x, col_y, col_color=None, width=RASTER_WIDTH, height=RASTER_HEIGHT
+    ):
+        bounds = self.value_range(col_x, col_y)
+        (x_min, x_max), (y_min, y_max) = bounds or [(0, 1), (0, 1)]
+        span_x, span_y = (x_max - x_min) or 1, (y_max - y_min) or 1
+
+        color = f", {ident(col_color)} AS _color" if col_color else ""
+        table = self.query(
+            f"SELECT {cell_index(col_x, x_min, span_x, width)} AS _cell_x, "
+            f"{cell_index(col_y, y_min, span_y, height)} AS _cell_y{color}, "
+            f"count(*) AS _count FROM {self.source} "
+            f"WHERE {is_valid(col_x, col_y)} GROUP BY ALL"
+        )
+
+        categories = None
+        codes = np.zeros(len(table), dtype=np.int64)
+        if col_color:
+            codes, categories = pd.factorize(table["_color"], use_na_sentinel=False)
+        pixels = table["_cell_y"].to_numpy() * width + table["_cell_x"].to_numpy()
+        keys = codes.astype(np.int64) * (width * height) + pixels
+
+        bounds = (x_min, span_x, y_min, span_y)
+        counts = table["_count"].to_numpy()
+        return raster_table(keys, counts, bounds, width, height, col_color, categories)
+
+
+def as_backend(df):
+    return PandasBackend(df) if isinstance(df, pd.DataFrame) else df
+
+
+def parquet_datasets(parquet_dir=PARQUET_DIR):
+    parquet_dir = Path(parquet_dir)
+    if not parquet_dir.is_dir():
+        return []
+    return sorted(
+        path.name.removesuffix(".parquet")
+        for path in parquet_dir.iterdir()
+        if path.suffix == ".parquet" or path.is_dir()
+    )
+
+
+def open_parquet(name, parquet_dir=PARQUET_DIR):
+    path = Path(parquet_dir) / name
+    return DuckDBBackend(path if path.is_dir() else path.with_suffix(".parquet"))
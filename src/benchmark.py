@@ -0,0 +1,262 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.elements.arrow_vega_lite import marshall
+from streamlit.logger import set_log_level
+from streamlit.proto.ArrowVegaLiteChart_pb2 import ArrowVegaLiteChart
+
+from src import plots
+from src.cache import RESULT_CACHE, share_frame
+from src.fingerprint import attach_fingerprint
+from src.sampling import cached_sample
+from src.timebuckets import time_pyramid
+
+# Synthetic datasets: every size is run with every shape (columns and cardinality)
+BENCHMARK_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+BENCHMARK_SHAPES = {
+    "narrow": {"n_num": 2, "n_cat": 2, "cardinality": 5},
+    "wide": {"n_num": 16, "n_cat": 8, "cardinality": 1_000},
+}
+BENCHMARK_REPEAT = 3
+BENCHMARK_NAN_SHARE = 0.01
+# A metric regresses when it grows by more than both a ratio and an absolute amount,
+# so that the noise of millisecond timings (or of small allocations) is ignored
+TOLERANCES = {
+    "build_s": (1.25, 0.01),
+    "serialize_s": (1.25, 0.01),
+    "payload_bytes": (1.05, 0),
+    "peak_bytes": (1.1, 2**20),
+}
+
+# Every plot of src/plots.py, called on columns num_0, num_1, cat_0, cat_1 and date
+SCENARIOS = {
+    "bar_count": (plots.plot_bar, {"col_x": "cat_0", "agg": "count"}),
+    "bar_mean": (plots.plot_bar, {"col_x": "cat_0", "col_y": "num_0", "agg": "mean"}),
+    "bar_normed": (
+        plots.plot_bar,
+        {"col_x": "cat_0", "col_color": "cat_1", "agg": "count", "norm": True},
+    ),
+    "bar_grouped": (
+        plots.plot_bar,
+        {
+            "col_x": "cat_0",
+            "col_y": "num_0",
+            "col_color": "cat_1",
+            "agg": "mean",
+            "group": True,
+        },
+    ),
+    "timeseries_count": (
+        plots.plot_timeseries,
+        {"mark": "line", "col_x": "date", "unit": "month", "agg": "count"},
+    ),
+    "timeseries_mean": (
+        plots.plot_timeseries,
+        {
+            "mark": "line",
+            "col_x": "date",
+            "unit": "yearmonthdate",
+            "col_y": "num_0",
+            "col_color": "cat_0",
+            "agg": "mean",
+        },
+    ),
+    "series_heatmap": (
+        plots.plot_series_heatmap,
+        {"col_date": "date", "col_color": "num_0", "unit_x": "date", "unit_y": "month"},
+    ),
+    "histo": (plots.plot_histo, {"col_x": "num_0", "bin": 30}),
+    "histo_stacked": (plots.plot_histo, {"col_x": "num_0", "col_color": "cat_0"}),
+    "histo_layered": (
+        plots.plot_histo,
+        {"col_x": "num_0", "col_color": "cat_0", "layered": True},
+    ),
+    "histo_2d": (
+        plots.plot_2d_histo,
+        {
+            "mark": "rect",
+            "col_x": "num_0",
+            "col_y": "num_1",
+            "bin_x": 30,
+            "bin_y": 30,
+            "ordinal": False,
+        },
+    ),
+    "box": (
+        plots.plot_box,
+        {"col_x": "cat_0", "col_y": "num_0", "col_color": "", "zero": True},
+    ),
+    "scatter": (
+        plots.plot_scatter,
+        {"mark": "circle", "col_x": "num_0", "col_y": "num_1", "col_color": "cat_0"},
+    ),
+    "density": (
+        plots.plot_density,
+        {"col_x": "num_0", "col_y": "num_1", "col_color": "cat_0"},
+    ),
+    "donut_simple": (plots.plot_donut_simple, {"col_color": "cat_0"}),
+    "donut_complex": (
+        plots.plot_donut_complex,
+        {"col_color_1": "cat_0", "col_color_2": "cat_1"},
+    ),
+    "line": (
+        plots.plot_line,
+        {"col_x": "num_0", "col_y": "num_1", "col_color": "cat_0"},
+    ),
+}
+
+
+def make_frame(n_rows, n_num, n_cat, cardinality, seed=0):
+    # Compacted dtypes, as prepared by the app: float32 values (with a few NaN),
+    # categorical strings and second resolution dates
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for i in range(n_num):
+        values = rng.normal(i, 1 + i, n_rows).astype(np.float32)
+        values[rng.random(n_rows) < BENCHMARK_NAN_SHARE] = np.nan
+        columns[f"num_{i}"] = values
+    categories = [f"c{i}" for i in range(cardinality)]
+    for i in range(n_cat):
+        codes = rng.integers(0, cardinality, n_rows)
+        columns[f"cat_{i}"] = pd.Categorical.from_codes(codes, categories)
+    dates = pd.date_range(start="2000-01-01", end="2022-01-01", periods=n_rows)
+    columns["date"] = dates.floor("s").astype("datetime64[s]")
+
+    df = pd.DataFrame(columns)
+    attach_fingerprint(df, source={"benchmark": [n_rows, n_num, n_cat, cardinality]})
+    share_frame(df)
+    return df
+
+
+def clear_caches():
+    # Every measure is a cold run: no chart, time bucket or sample computed before
+    RESULT_CACHE.clear()
+    time_pyramid.clear()
+    cached_sample.clear()
+
+
+def build(plot, df, kwargs):
+    # Charts plotted by a stubbed st.vega_lite_chart, no server nor browser involved
+    charts = []
+    with mock.patch.object(st, "vega_lite_chart", lambda **chart: charts.append(chart)):
+        plot(df, **kwargs)
+    return charts
+
+
+def measure(plot, df, kwargs, repeat=BENCHMARK_REPEAT):
+    build_s, serialize_s = [], []
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        charts = build(plot, df, kwargs)
+        build_s.append(time.perf_counter() - start)
+
+        # Protobuf messages sent by Streamlit to the browser (Arrow data + JSON spec)
+        protos = [ArrowVegaLiteChart() for _ in charts]
+        start = time.perf_counter()
+        for proto, chart in zip(protos, charts):
+            marshall(proto, **chart)
+        serialize_s.append(time.perf_counter() - start)
+
+    # Peak memory is traced in a separate run, tracing slows allocations down
+    clear_caches()
+    tracemalloc.start()
+    for chart in build(plot, df, kwargs):
+        marshall(ArrowVegaLiteChart(), **chart)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "build_s": round(min(build_s), 6),
+        "serialize_s": round(min(serialize_s), 6),
+        "payload_bytes": sum(proto.ByteSize() for proto in protos),
+        "peak_bytes": peak_bytes,
+        "charts": len(charts),
+    }
+
+
+def run(sizes=BENCHMARK_SIZES, shapes=BENCHMARK_SHAPES, scenarios=None, repeat=None):
+    results = []
+    for n_rows in sizes:
+        for shape, params in shapes.items():
+            df = make_frame(n_rows, **params)
+            for name, (plot, kwargs) in SCENARIOS.items():
+                if scenarios and name not in scenarios:
+                    continue
+                result = measure(plot, df, kwargs, repeat or BENCHMARK_REPEAT)
+                results.append(
+                    {"scenario": name, "rows": n_rows, "shape": shape, **result}
+                )
+                print(json.dumps(results[-1]), file=sys.stderr)
+            del df
+    return results
+
+
+def report(results):
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "versions": {
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "streamlit": st.__version__,
+        },
+        "shapes": BENCHMARK_SHAPES,
+        "results": results,
+    }
+
+
+def compare(baseline, results):
+    # Metrics that grew beyond the tolerance, per scenario found in both reports
+    keys = ("scenario", "rows", "shape")
+    previous = {tuple(r[k] for k in keys): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get(tuple(result[k] for k in keys))
+        if before is None:
+            continue
+        for metric, (ratio, delta) in TOLERANCES.items():
+            value, value_before = result[metric], before[metric]
+            if value > ratio * value_before and value - value_before > delta:
+                growth = round(value / max(value_before, 1e-9), 3)
+                regressions.append({**{k: result[k] for k in keys}, metric: growth})
+    return regressions
+
+
+if __name__ == "__main__":
+    # e.g. python -m src.benchmark --sizes 1000 100000 --output benchmark.json
+    parser = argparse.ArgumentParser(description="Benchmark the charts of src/plots.py")
+    parser.add_argument("--sizes", type=int, nargs="+", default=BENCHMARK_SIZES)
+    parser.add_argument("--shapes", nargs="+", choices=list(BENCHMARK_SHAPES))
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument("--output", help="Report file (JSON), printed if not set")
+    parser.add_argument("--baseline", help="Previous report, exits with 1 on regressions")
+    args = parser.parse_args()
+
+    # Streamlit warns about caches used without a running app
+    set_log_level("error")
+    shapes = {name: BENCHMARK_SHAPES[name] for name in args.shapes or BENCHMARK_SHAPES}
+    results = run(args.sizes, shapes, args.scenarios, args.repeat)
+
+    output = json.dumps(report(results), indent=1, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(json.load(file), results)
+        for regression in regressions:
+            print(f"Regression: {json.dumps(regression)}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,144 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Default number of bins used by Vega-Lite for positional channels
+MAXBINS_DEFAULT = 10
+
+FIELD_BIN_X = "bin_col_x"
+FIELD_BIN_X_END = "bin_col_x_end"
+FIELD_BIN_X_RANGE = "bin_col_x_range"
+FIELD_BIN_Y = "bin_col_y"
+FIELD_BIN_Y_END = "bin_col_y_end"
+FIELD_BIN_Y_RANGE = "bin_col_y_range"
+FIELD_COUNT = "xCount"
+FIELD_PERCENT = "PercentOfTotal"
+FIELDS_BIN_X = (FIELD_BIN_X, FIELD_BIN_X_END, FIELD_BIN_X_RANGE)
+FIELDS_BIN_Y = (FIELD_BIN_Y, FIELD_BIN_Y_END, FIELD_BIN_Y_RANGE)
+
+
+def nice_bins(vmin, vmax, maxbins=MAXBINS_DEFAULT, base=10, divide=(5, 2)):
+    # Port of the vega-statistics bin step selection (nice=True, no minstep)
+    logb = math.log(base)
+    span = (vmax - vmin) or abs(vmin) or 1
+    level = math.ceil(math.log(maxbins) / logb)
+    step = base ** math.floor(math.log(span) / logb - level + 0.5)
+
+    while math.ceil(span / step) > maxbins:
+        step *= base
+
+    for div in divide:
+        if span / (step / div) <= maxbins:
+            step /= div
+
+    v = math.log(step)
+    precision = 0 if v >= 0 else int(-v / logb) + 1
+    eps = base ** (-precision - 1)
+    start = math.floor(vmin / step + eps) * step
+    start = start - step if vmin < start else start
+    stop = math.ceil(vmax / step) * step
+    stop = start + step if stop == start else stop
+    return start, stop, step, precision
+
+
+def range_edges(vmin, vmax, maxbins=None):
+    start, stop, step, precision = nice_bins(vmin, vmax, maxbins or MAXBINS_DEFAULT)
+    n_bins = max(round((stop - start) / step), 1)
+    return start + step * np.arange(n_bins + 1, dtype=float), step, precision
+
+
+def bin_edges(values, maxbins=None):
+    return range_edges(np.min(values), np.max(values), maxbins)
+
+
+def format_range(start, end, precision):
+    # Labels of discrete binned fields, as rendered by Vega-Lite ("start – end")
+    start = [np.format_float_positional(v, precision, trim="-") for v in start]
+    end = [np.format_float_positional(v, precision, trim="-") for v in end]
+    return [f"{s} – {e}" for s, e in zip(start, end)]
+
+
+def bin_columns(edges, precision, idx_bin, fields=FIELDS_BIN_X):
+    field, field_end, field_range = fields
+    edges = np.round(edges, precision)
+    return {
+        field: edges[idx_bin],
+        field_end: edges[idx_bin + 1],
+        field_range: format_range(edges[idx_bin], edges[idx_bin + 1], precision),
+    }
+
+
+def to_float(series):
+    return series.to_numpy(dtype=float, na_value=np.nan)
+
+
+def histogram(df, col_x, col_color=None, maxbins=None, normalize=False):
+    values = to_float(df[col_x])
+    valid = ~np.isnan(values)
+    if not valid.any():
+        columns = [FIELD_BIN_X, FIELD_BIN_X_END, FIELD_BIN_X_RANGE, FIELD_COUNT]
+        return pd.DataFrame(columns=columns + ([col_color] if col_color else [])), 1
+
+    edges, step, precision = bin_edges(values[valid], maxbins)
+    if col_color:
+        codes, categories = pd.factorize(df[col_color], use_na_sentinel=False)
+        counts, _, _ = np.histogram2d(
+            values[valid],
+            codes[valid],
+            bins=[edges, np.arange(len(categories) + 1) - 0.5],
+        )
+        idx_bin, idx_color = np.nonzero(counts)
+        counts = counts[idx_bin, idx_color]
+    else:
+        counts, _ = np.histogram(values[valid], bins=edges)
+        (idx_bin,) = np.nonzero(counts)
+        counts = counts[idx_bin]
+
+    colors = categories.take(idx_color) if col_color else None
+    table = histogram_table(
+        edges, precision, idx_bin, counts, col_color, colors, normalize
+    )
+    return table, step
+
+
+def histogram_table(
+    edges, precision, idx_bin, counts, col_color=None, colors=None, normalize=False
+):
+    table = pd.DataFrame(
+        {
+            **bin_columns(edges, precision, idx_bin),
+            FIELD_COUNT: np.asarray(counts).astype(np.int64),
+        }
+    )
+    if col_color:
+        table[col_color] = colors
+    if normalize:
+        table[FIELD_PERCENT] = table[FIELD_COUNT] / table[FIELD_COUNT].sum()
+    return table
+
+
+def histogram_2d(df, col_x, col_y, bin_x=None, bin_y=None):
+    values_x, values_y = to_float(df[col_x]), to_float(df[col_y])
+    valid = ~(np.isnan(values_x) | np.isnan(values_y))
+    if not valid.any():
+        columns = [FIELD_BIN_X, FIELD_BIN_X_END, FIELD_BIN_X_RANGE]
+        columns += [FIELD_BIN_Y, FIELD_BIN_Y_END, FIELD_BIN_Y_RANGE, FIELD_COUNT]
+        return pd.DataFrame(columns=columns), 1, 1
+
+    edges_x, step_x, precision_x = bin_edges(values_x[valid], bin_x)
+    edges_y, step_y, precision_y = bin_edges(values_y[valid], bin_y)
+    counts, _, _ = np.histogram2d(
+        values_x[valid],
+        values_y[valid],
+        bins=[edges_x, edges_y],
+    )
+    idx_x, idx_y = np.nonzero(counts)
+    table = pd.DataFrame(
+        {
+            **bin_columns(edges_x, precision_x, idx_x, FIELDS_BIN_X),
+            **bin_columns(edges_y, precision_y, idx_y, FIELDS_BIN_Y),
+            FIELD_COUNT: counts[idx_x, idx_y].astype(np.int64),
+        }
+    )
+    return table, step_x, step_y
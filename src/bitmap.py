@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Categorical columns with at most this many values are indexed, each value costing
+# one bit per row
+BITMAP_MAX_VALUES = int(os.environ.get("VEGA_CHARTS_BITMAP_MAX_VALUES", 50))
+# Set bits of each byte value
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+class BitmapIndex:
+    # Rows of each value of the categorical columns, as bitsets packed 8 rows per byte:
+    # a filter is an AND (across columns) of ORs (across values) of these bitsets, which
+    # reads n_rows / 8 bytes per value instead of comparing every row
+    def __init__(self, df, columns):
+        self.n_rows = len(df)
+        self.values, self.positions, self.bitsets = {}, {}, {}
+        for col in columns:
+            codes, uniques = pd.factorize(df[col], sort=True)
+            if not len(uniques):
+                continue
+            self.values[col] = uniques.tolist()
+            self.positions[col] = {value: i for i, value in enumerate(self.values[col])}
+            self.bitsets[col] = np.stack(
+                [np.packbits(codes == i) for i in range(len(uniques))]
+            )
+
+    def select(self, filters):
+        # Selection of the rows matching {column: values} (every row if no filter)
+        selection = np.packbits(np.ones(self.n_rows, dtype=bool))
+        for col, values in filters.items():
+            positions = [self.positions[col][value] for value in values]
+            selection &= np.bitwise_or.reduce(self.bitsets[col][positions], axis=0)
+        return selection
+
+    def rows(self, selection):
+        # Positions of the selected rows, in order
+        return np.flatnonzero(np.unpackbits(selection, count=self.n_rows))
+
+    def count(self, selection):
+        # Set bits (selected rows), counted per byte
+        return int(POPCOUNT[selection].sum())
+
+
+def build_index(df, profile, max_values=BITMAP_MAX_VALUES):
+    columns = [
+        col for col in profile["cat"] if profile["columns"][col]["distinct"] <= max_values
+    ]
+    return BitmapIndex(df, columns)
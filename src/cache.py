@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+
+# Memory budget of the chart results shared by every session of the server process
+CACHE_MAX_BYTES = int(os.environ.get("VEGA_CHARTS_CACHE_BYTES", 256 * 2**20))
+
+
+# Ids of the frames held for the life of the server (prepared datasets): results
+# referencing them keep nothing alive
+SHARED_FRAMES = set()
+
+
+def share_frame(df):
+    SHARED_FRAMES.add(id(df))
+    weakref.finalize(df, SHARED_FRAMES.discard, id(df))
+
+
+def result_bytes(value):
+    # Approximate memory held by a result, other frames (e.g. filtered rows) count in
+    # full, as the result keeps them alive
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        if id(value) in SHARED_FRAMES:
+            return 0
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (list, tuple)):
+        return sum(result_bytes(item) for item in value)
+    return len(json.dumps(value, default=str))
+
+
+class ResultCache:
+    # Process-wide LRU cache bounded by the total size of its entries, where concurrent
+    # requests of the same missing key wait for a single computation
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def lookup(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key][0]
+        return False, None
+
+    def store(self, key, value, n_bytes):
+        if n_bytes > self.max_bytes:
+            return
+        self.entries[key] = (value, n_bytes)
+        self.n_bytes += n_bytes
+        while self.n_bytes > self.max_bytes:
+            _, (_, evicted_bytes) = self.entries.popitem(last=False)
+            self.n_bytes -= evicted_bytes
+            self.evictions += 1
+
+    def get(self, key, compute, size=result_bytes):
+        with self.lock:
+            found, value = self.lookup(key)
+            if found:
+                return value
+            key_lock = self.pending.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self.lock:
+                found, value = self.lookup(key)
+                if found:
+                    return value
+                self.misses += 1
+            try:
+                value = compute()
+                with self.lock:
+                    self.store(key, value, size(value))
+            finally:
+                with self.lock:
+                    self.pending.pop(key, None)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.n_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.n_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+RESULT_CACHE = ResultCache()
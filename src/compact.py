@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from pandas.api import types
+
+
+def compact_float(series):
+    # Only downcast when every value survives the float32 round trip
+    values = series.to_numpy()
+    values_32 = values.astype(np.float32)
+    if np.array_equal(values_32.astype(values.dtype), values, equal_nan=True):
+        return pd.Series(values_32, index=series.index, name=series.name)
+    return series
+
+
+def compact_datetime(series):
+    # Second resolution timestamps (when lossless), stored as timestamp[s] by Arrow.
+    # Needs pandas 2 (pinned in pyproject.toml): older versions only hold nanoseconds
+    compacted = series.astype("datetime64[s]")
+    values = series.to_numpy()
+    lossless = np.array_equal(
+        compacted.to_numpy().astype(values.dtype), values, equal_nan=True
+    )
+    return compacted if lossless else series
+
+
+def compact_series(series, categorical=False):
+    if types.is_bool_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    if types.is_integer_dtype(series) and not types.is_extension_array_dtype(series):
+        return pd.to_numeric(series, downcast="integer")
+    if types.is_float_dtype(series) and not types.is_extension_array_dtype(series):
+        return compact_float(series)
+    if types.is_datetime64_dtype(series):
+        return compact_datetime(series)
+    if categorical and (types.is_object_dtype(series) or types.is_string_dtype(series)):
+        # Dictionary encoded by Arrow when serialized for the browser, only worth it
+        # when values repeat
+        if series.nunique(dropna=False) <= len(series) // 2:
+            return series.astype("category")
+    return series
+
+
+def compact(df, cat_cols=()):
+    # Shrink the dtypes of df in place, returns the memory footprint before/after
+    memory_before = int(df.memory_usage(deep=True).sum())
+    for col in df.columns:
+        series = df[col]
+        compacted = compact_series(series, categorical=col in cat_cols)
+        if compacted is not series:
+            df[col] = compacted
+    memory_after = int(df.memory_usage(deep=True).sum())
+    return {"before": memory_before, "after": memory_after}
@@ -0,0 +1,185 @@
+import copy
+import os
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from src.aggregations import FIELD_AGG, donut_shares, normalize_bar
+from src.metrics import timed
+
+# Categorical dimensions of a cube, lowest cardinality first, while the number of
+# possible cells stays under the limit (0 dimensions: no cube)
+CUBE_MAX_DIMENSIONS = int(os.environ.get("VEGA_CHARTS_CUBE_DIMENSIONS", 4))
+CUBE_MAX_CELLS = int(os.environ.get("VEGA_CHARTS_CUBE_CELLS", 100_000))
+CUBE_AGGREGATIONS = ["count", "sum", "mean", "var", "std"]
+# Cubes of the prepared frames, by id of the frame and removed with it
+CUBES = {}
+
+
+class DataCube:
+    # Counts, and counts/sums/M2 (squared deviations) of each measure, per combination
+    # of the dimensions found in the data (sparse: only observed cells are stored).
+    # Charts roll cells up to their own dimensions, without reading rows again
+    def __init__(self, df, dimensions, measures):
+        self.dimensions, self.measures = dimensions, measures
+        self.uniques = {}
+        codes = []
+        for col in dimensions:
+            col_codes, uniques = pd.factorize(df[col])
+            codes.append(col_codes + 1)  # 0: missing value
+            self.uniques[col] = pd.Series(uniques)
+
+        # Cells numbered by first appearance, as groups of groupby(sort=False)
+        sizes = self.sizes(dimensions)
+        flat = np.ravel_multi_index(codes, sizes) if codes else np.zeros(len(df), int)
+        cell, cells = pd.factorize(flat)
+        self.codes = dict(zip(dimensions, np.unravel_index(cells, sizes)))
+        self.count = np.bincount(cell, minlength=len(cells))
+        self.stats = {}
+        for col in measures:
+            # Valid values, mean and sum of squared deviations to the mean (M2) per
+            # cell: variances are merged from these without the cancellation of
+            # sum(x^2) - sum(x)^2 / n
+            values = df[col].to_numpy(dtype=float)
+            valid = ~np.isnan(values)
+            values = np.where(valid, values, 0.0)
+            n = np.bincount(cell, weights=valid, minlength=len(cells))
+            total = np.bincount(cell, weights=values, minlength=len(cells))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                mean = np.where(n > 0, total / n, 0.0)
+            deviations = np.where(valid, values - mean[cell], 0.0)
+            m2 = np.bincount(cell, weights=deviations * deviations, minlength=len(cells))
+            self.stats[col] = (n, total, mean, m2)
+
+    def __len__(self):
+        return len(self.count)
+
+    def sizes(self, dimensions):
+        return [len(self.uniques[col]) + 1 for col in dimensions]
+
+    def covers(self, keys, col_y=None, agg="count"):
+        return (
+            all(col in self.uniques for col in keys)
+            and (agg == "count" or col_y in self.stats)
+            and agg in CUBE_AGGREGATIONS
+        )
+
+    def covers_filters(self, filters):
+        return all(col in self.uniques for col in filters)
+
+    def select(self, filters):
+        # Cube of the rows with these {column: values}: cells hold whole groups of rows,
+        # so it only keeps the cells of the selected values (no row is read)
+        keep = np.ones(len(self), dtype=bool)
+        for col, values in filters.items():
+            codes = np.flatnonzero(self.uniques[col].isin(values)) + 1
+            keep &= np.isin(self.codes[col], codes)
+        cube = copy.copy(self)
+        cube.codes = {col: codes[keep] for col, codes in self.codes.items()}
+        cube.count = self.count[keep]
+        cube.stats = {
+            col: tuple(stat[keep] for stat in stats) for col, stats in self.stats.items()
+        }
+        return cube
+
+    def rollup(self, keys):
+        # Group of each cell for these dimensions (in order of first appearance), and
+        # the table of their values
+        if not keys:
+            return np.zeros(len(self), dtype=np.int64), pd.DataFrame(index=range(1))
+        sizes = self.sizes(keys)
+        flat = np.ravel_multi_index([self.codes[col] for col in keys], sizes)
+        group, groups = pd.factorize(flat)
+        codes = np.unravel_index(groups, sizes)
+        table = pd.DataFrame(
+            {
+                col: self.uniques[col].reindex(col_codes - 1).reset_index(drop=True)
+                for col, col_codes in zip(keys, codes)
+            }
+        )
+        return group, table
+
+    def aggregate(self, group, n_groups, col_y=None, agg="count"):
+        if agg == "count":
+            return np.bincount(group, self.count, n_groups).astype(np.int64)
+        n_cell, total_cell, mean_cell, m2_cell = self.stats[col_y]
+        n = np.bincount(group, n_cell, n_groups)
+        total = np.bincount(group, total_cell, n_groups)
+        if agg == "sum":
+            return total
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(n > 0, total / n, np.nan)
+            if agg == "mean":
+                return mean
+            # Chan et al.: M2 of a group = sum of M2 + n * (mean - group mean)^2 per cell
+            shift = np.where(n_cell > 0, mean_cell - mean[group], 0.0)
+            m2 = np.bincount(group, m2_cell + n_cell * shift * shift, n_groups)
+            var = np.where(n > 1, m2 / (n - 1), np.nan)
+        return np.sqrt(var) if agg == "std" else var
+
+    def aggregate_bar(self, col_x, col_y=None, col_color=None, agg="count", norm=False):
+        keys = list(dict.fromkeys(col for col in (col_x, col_color) if col))
+        group, table = self.rollup(keys)
+        table[FIELD_AGG] = self.aggregate(group, len(table), col_y, agg)
+        return normalize_bar(table, col_x) if norm else table
+
+    def donut_counts(self, col_color_1, col_color_2=None):
+        keys = list(dict.fromkeys(col for col in (col_color_1, col_color_2) if col))
+        group, table = self.rollup(keys)
+        table["groupcount2"] = self.aggregate(group, len(table))
+        return donut_shares(table, col_color_1)
+
+
+def cube_dimensions(
+    profile, max_dimensions=CUBE_MAX_DIMENSIONS, max_cells=CUBE_MAX_CELLS
+):
+    # Distinct values (+ missing) of the categorical columns bound the number of cells
+    cardinality = {col: profile["columns"][col]["distinct"] + 1 for col in profile["cat"]}
+    dimensions, n_cells = [], 1
+    for col in sorted(cardinality, key=cardinality.get):
+        n_cells *= cardinality[col]
+        if len(dimensions) == max_dimensions or n_cells > max_cells:
+            break
+        dimensions.append(col)
+    return dimensions
+
+
+def build_cube(df, profile):
+    # One pass over the rows, when the dataset is prepared
+    dimensions = cube_dimensions(profile)
+    if not dimensions:
+        return None
+    return DataCube(df, dimensions, profile["num"])
+
+
+def attach_cube(df, cube):
+    # Kept as long as df: frames derived from it (filtered, projected..) have their
+    # own ids, so they have no cube
+    CUBES[id(df)] = cube
+    weakref.finalize(df, CUBES.pop, id(df), None)
+
+
+def get_cube(df):
+    return CUBES.get(id(df))
+
+
+class CubeBackend:
+    # Bar and donut charts of a dataset (or a selection of its rows) answered by a cube
+    # only, as for query backends charts only get aggregated results
+    in_memory = False
+
+    def __init__(self, cube, fingerprint):
+        self.cube = cube
+        self.fingerprint = fingerprint
+
+    def __len__(self):
+        return int(self.cube.count.sum())
+
+    @timed("aggregate")
+    def aggregate_bar(self, col_x, col_y=None, col_color=None, agg="count", norm=False):
+        return self.cube.aggregate_bar(col_x, col_y, col_color, agg, norm)
+
+    @timed("aggregate")
+    def donut_counts(self, col_color_1, col_color_2=None):
+        return self.cube.donut_counts(col_color_1, col_color_2)
@@ -0,0 +1,58 @@
+import hashlib
+import json
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# Content hash of a few blocks of rows: the first, the last and evenly spaced ones in
+# between, so that fingerprinting costs the same whatever the size of the frame
+FINGERPRINT_BLOCKS = 16
+FINGERPRINT_BLOCK_ROWS = 1024
+# Fingerprints of frames, by id of the frame and removed with it: an id is only reused
+# once its frame is collected, so it never finds the fingerprint of another frame
+FINGERPRINTS = {}
+
+
+def block_starts(n_rows, n_blocks=FINGERPRINT_BLOCKS, block_rows=FINGERPRINT_BLOCK_ROWS):
+    if n_rows <= n_blocks * block_rows:
+        return range(0, n_rows, block_rows)
+    return np.unique(np.linspace(0, n_rows - block_rows, n_blocks).astype(np.int64))
+
+
+def fingerprint(
+    df, source=None, n_blocks=FINGERPRINT_BLOCKS, block_rows=FINGERPRINT_BLOCK_ROWS
+):
+    # Source identity (e.g. store manifest) + schema + sampled content, hashed together
+    digest = hashlib.blake2b(digest_size=16)
+    schema = [[str(col), str(dtype)] for col, dtype in df.dtypes.items()]
+    header = {"source": source, "rows": len(df), "schema": schema}
+    digest.update(json.dumps(header, sort_keys=True, default=str).encode())
+    for start in block_starts(len(df), n_blocks, block_rows):
+        end = start + block_rows
+        block = df.iloc[start:end]
+        digest.update(pd.util.hash_pandas_object(block, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def derive_fingerprint(value, source):
+    # Data derived from a fingerprinted dataset without copying it (e.g. its filtered
+    # aggregates), identified by the dataset and how it is derived
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([value, source], sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def attach_fingerprint(df, source=None):
+    # Computed once when the dataset is prepared, then looked up by frame
+    if id(df) not in FINGERPRINTS:
+        weakref.finalize(df, FINGERPRINTS.pop, id(df), None)
+    FINGERPRINTS[id(df)] = fingerprint(df, source)
+    return FINGERPRINTS[id(df)]
+
+
+def get_fingerprint(df):
+    # Frames derived from df (projections, filters..) have their own ids, so their own
+    # fingerprint, computed from their content
+    value = FINGERPRINTS.get(id(df))
+    return attach_fingerprint(df) if value is None else value
@@ -0,0 +1,357 @@
+import abc
+import io
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.aggregations import FIELD_AGG
+from src.binning import FIELD_BIN_X, FIELD_BIN_X_END, FIELD_COUNT, range_edges
+from src.plots import CONFIG_MAIN, CONFIG_MARK
+from src.store import STORE_DIR
+
+# Append-only CSV files (e.g. written by a logger, or a queue consumer), tailed by the
+# app: each chart keeps running aggregates and only sends the rows of new batches
+LIVE_DIR = Path(os.environ.get("VEGA_CHARTS_LIVE_DIR", STORE_DIR / "live"))
+LIVE_INTERVAL = float(os.environ.get("VEGA_CHARTS_LIVE_INTERVAL", 1.0))
+# Raw rows kept for scatter and line charts (the browser holds at most twice as many)
+LIVE_WINDOW_ROWS = int(os.environ.get("VEGA_CHARTS_LIVE_WINDOW_ROWS", 10_000))
+LIVE_MAXBINS = 20
+# Live histograms are re-binned to a coarser step once their bins span this many times
+# maxbins (values far out of the range of the first batch)
+LIVE_REBIN_FACTOR = 4
+# Charts are redrawn from their running aggregate every N batches, so that the data of
+# the browser (initial table + deltas) does not grow with the number of batches
+LIVE_REDRAW_BATCHES = int(os.environ.get("VEGA_CHARTS_LIVE_REDRAW_BATCHES", 50))
+FIELD_SUM = "_sum"
+# Time buckets of live time series, as pandas period frequencies
+LIVE_TIME_UNITS = {"year": "Y", "month": "M", "day": "D", "hours": "h", "minutes": "min"}
+
+
+def live_datasets(live_dir=LIVE_DIR):
+    live_dir = Path(live_dir)
+    if not live_dir.is_dir():
+        return []
+    return sorted(path.name for path in live_dir.glob("*.csv"))
+
+
+class CsvFeed:
+    # Reads the lines appended to a CSV file since the previous read (complete lines
+    # only, a line being written is read next time)
+    def __init__(self, path):
+        self.path = Path(path)
+        self.offset = 0
+        self.header = None
+        self.n_rows = 0
+
+    def read(self):
+        with self.path.open("rb") as file:
+            file.seek(self.offset)
+            data = file.read()
+        data = data[: data.rfind(b"\n") + 1]
+        self.offset += len(data)
+        if self.header is None and data:
+            end = data.index(b"\n") + 1
+            self.header, data = data[:end], data[end:]
+        if not self.header:
+            return pd.DataFrame()
+
+        batch = pd.read_csv(io.BytesIO(self.header + data))
+        self.n_rows += len(batch)
+        return batch
+
+
+class RunningAggregate(abc.ABC):
+    # Counts (and sums of col_y) per key, merged batch by batch. The partial aggregate
+    # of a batch is the delta sent to the browser, where the spec sums partials by key,
+    # so that memory grows with the number of keys (and of batches between redraws),
+    # not of rows
+    def __init__(self, col_y=None):
+        self.col_y = col_y
+        self.running = None
+        self.n_batches = 0
+
+    @abc.abstractmethod
+    def keys(self, batch):
+        # Frame of the key columns of each row of the batch
+        ...
+
+    def update(self, batch):
+        keys = self.keys(batch)
+        if self.col_y:
+            values = pd.to_numeric(batch[self.col_y], errors="coerce")
+            keys[FIELD_COUNT] = values.notna().to_numpy(np.int64)
+            keys[FIELD_SUM] = values.fillna(0).to_numpy(float)
+        else:
+            keys[FIELD_COUNT] = 1
+        columns = [col for col in keys.columns if col not in (FIELD_COUNT, FIELD_SUM)]
+
+        delta = keys.groupby(columns, dropna=False, sort=False).sum().reset_index()
+        if self.running is None:
+            self.running = delta
+        else:
+            merged = pd.concat([self.running, delta], ignore_index=True)
+            self.running = (
+                merged.groupby(columns, dropna=False, sort=False).sum().reset_index()
+            )
+        # None every LIVE_REDRAW_BATCHES batches: the chart is redrawn from the running
+        # aggregate, which replaces the deltas accumulated by the browser
+        self.n_batches += 1
+        return None if self.n_batches % LIVE_REDRAW_BATCHES == 0 else delta
+
+    def table(self):
+        return self.running
+
+    def transform(self, groupby):
+        # Partial aggregates (initial table + deltas) summed in the browser
+        aggregate = [{"op": "sum", "field": FIELD_COUNT, "as": FIELD_COUNT}]
+        transform = [{"aggregate": aggregate, "groupby": groupby}]
+        if self.col_y:
+            aggregate.append({"op": "sum", "field": FIELD_SUM, "as": FIELD_SUM})
+            expr = f"datum['{FIELD_SUM}'] / datum['{FIELD_COUNT}']"
+            transform.append({"calculate": expr, "as": FIELD_AGG})
+        return transform
+
+    def encoding_y(self):
+        if self.col_y:
+            return {
+                "field": FIELD_AGG,
+                "type": "quantitative",
+                "title": f"Mean {self.col_y}",
+            }
+        return {"field": FIELD_COUNT, "type": "quantitative", "title": "Count"}
+
+
+def key_columns(*cols):
+    return list(dict.fromkeys(col for col in cols if col))
+
+
+def encoding_color(col_color):
+    return {"color": {"field": col_color, "type": "nominal"}} if col_color else {}
+
+
+class LiveBar(RunningAggregate):
+    def __init__(self, col_x, col_y=None, col_color=None):
+        super().__init__(col_y)
+        self.col_x, self.col_color = col_x, col_color
+
+    def keys(self, batch):
+        return batch[key_columns(self.col_x, self.col_color)].copy()
+
+    def spec(self):
+        groupby = key_columns(self.col_x, self.col_color)
+        return {
+            **CONFIG_MAIN,
+            "transform": self.transform(groupby),
+            "mark": {"type": "bar", **CONFIG_MARK},
+            "encoding": {
+                "x": {"field": self.col_x, "type": "ordinal", "axis": {"labelAngle": 0}},
+                "y": self.encoding_y(),
+                **encoding_color(self.col_color),
+            },
+        }
+
+
+class LiveHistogram(RunningAggregate):
+    # Bins are fixed by the first batch (nice step and start), later values outside of
+    # its range fall in new bins of the same step, until there are too many of them:
+    # bins are then merged into a coarser nice step (multiple of the current one)
+    def __init__(self, col_x, col_color=None, maxbins=LIVE_MAXBINS):
+        super().__init__()
+        self.col_x, self.col_color, self.maxbins = col_x, col_color, maxbins
+        self.start = self.step = self.precision = None
+
+    def bins(self, values):
+        start = np.floor((values - self.start) / self.step) * self.step + self.start
+        return {
+            FIELD_BIN_X: np.round(start, self.precision),
+            FIELD_BIN_X_END: np.round(start + self.step, self.precision),
+        }
+
+    def keys(self, batch):
+        values = pd.to_numeric(batch[self.col_x], errors="coerce").to_numpy(float)
+        if self.step is None and not np.isnan(values).all():
+            edges, self.step, self.precision = range_edges(
+                np.nanmin(values), np.nanmax(values), self.maxbins
+            )
+            self.start = edges[0]
+        if self.step is None:
+            # No bins until a first value arrives
+            keys = {FIELD_BIN_X: [], FIELD_BIN_X_END: []}
+            keys.update({self.col_color: []} if self.col_color else {})
+            return pd.DataFrame(keys)
+
+        keys = self.bins(values)
+        if self.col_color:
+            keys[self.col_color] = batch[self.col_color].to_numpy()
+        return pd.DataFrame(keys)
+
+    def update(self, batch):
+        # None when bins were merged: the chart is redrawn from the running aggregate
+        delta = super().update(batch)
+        if self.step is None or not len(self.running):
+            return delta
+        low = self.running[FIELD_BIN_X].min()
+        high = self.running[FIELD_BIN_X_END].max()
+        if (high - low) / self.step <= LIVE_REBIN_FACTOR * self.maxbins:
+            return delta
+
+        while (high - low) / self.step > self.maxbins:
+            # Nice steps 1, 2, 5 x 10^k: 1 -> 2, 2 -> 10, 5 -> 10
+            mantissa = round(self.step / 10 ** math.floor(math.log10(self.step)))
+            self.step *= 5 if mantissa == 2 else 2
+        self.precision = max(0, -math.floor(math.log10(self.step)))
+        self.start = math.floor(self.start / self.step) * self.step
+        running = self.running.drop(columns=[FIELD_BIN_X, FIELD_BIN_X_END])
+        # Old bins fall in the new bin of their middle (no rounding at its edges)
+        middle = (self.running[FIELD_BIN_X] + self.running[FIELD_BIN_X_END]) / 2
+        running = running.assign(**self.bins(middle.to_numpy()))
+        columns = key_columns(FIELD_BIN_X, FIELD_BIN_X_END, self.col_color)
+        grouped = running.groupby(columns, dropna=False, sort=False)
+        self.running = grouped[[FIELD_COUNT]].sum().reset_index()
+        return None
+
+    def spec(self):
+        groupby = key_columns(FIELD_BIN_X, FIELD_BIN_X_END, self.col_color)
+        return {
+            **CONFIG_MAIN,
+            "transform": self.transform(groupby),
+            "mark": {"type": "bar", **CONFIG_MARK},
+            "encoding": {
+                "x": {
+                    "field": FIELD_BIN_X,
+                    "type": "quantitative",
+                    "bin": {"binned": True, "step": self.step},
+                    "title": self.col_x,
+                },
+                "x2": {"field": FIELD_BIN_X_END},
+                "y": self.encoding_y(),
+                **encoding_color(self.col_color),
+            },
+        }
+
+
+class LiveTimeSeries(RunningAggregate):
+    def __init__(self, col_date, unit, col_y=None, col_color=None):
+        super().__init__(col_y)
+        self.col_date, self.unit, self.col_color = col_date, unit, col_color
+
+    def keys(self, batch):
+        dates = pd.to_datetime(batch[self.col_date], errors="coerce")
+        periods = dates.dt.to_period(LIVE_TIME_UNITS[self.unit])
+        keys = {self.col_date: periods.dt.start_time}
+        if self.col_color:
+            keys[self.col_color] = batch[self.col_color]
+        return pd.DataFrame(keys)
+
+    def spec(self):
+        groupby = key_columns(self.col_date, self.col_color)
+        return {
+            **CONFIG_MAIN,
+            "transform": self.transform(groupby),
+            "mark": {"type": "line", "point": True, "tooltip": True},
+            "encoding": {
+                "x": {"field": self.col_date, "type": "temporal"},
+                "y": self.encoding_y(),
+                **encoding_color(self.col_color),
+            },
+        }
+
+
+class LiveDonut(RunningAggregate):
+    def __init__(self, col_color):
+        super().__init__()
+        self.col_color = col_color
+
+    def keys(self, batch):
+        return batch[[self.col_color]].copy()
+
+    def spec(self):
+        transform = self.transform([self.col_color])
+        transform.append(
+            {"joinaggregate": [{"op": "sum", "field": FIELD_COUNT, "as": "total"}]}
+        )
+        transform.append(
+            {"calculate": f"datum['{FIELD_COUNT}'] / datum.total", "as": "share"}
+        )
+        return {
+            **CONFIG_MAIN,
+            "transform": transform,
+            "mark": {"type": "arc", "innerRadius": 100, **CONFIG_MARK},
+            "encoding": {
+                "theta": {"field": FIELD_COUNT, "type": "quantitative", "title": "Count"},
+                "color": {"field": self.col_color, "type": "nominal"},
+                "order": {"field": "share", "type": "quantitative", "sort": "descending"},
+                "tooltip": [
+                    {"field": self.col_color, "type": "nominal"},
+                    {"field": "share", "type": "quantitative", "format": ".1%"},
+                ],
+            },
+        }
+
+
+class LiveWindow:
+    # Last max_rows raw rows for scatter and line charts: new rows are appended in the
+    # browser until it holds twice the window, then the chart is redrawn from the window
+    def __init__(self, mark, col_x, col_y, col_color=None, max_rows=LIVE_WINDOW_ROWS):
+        self.mark, self.max_rows = mark, max_rows
+        self.col_x, self.col_y, self.col_color = col_x, col_y, col_color
+        self.rows = None
+        self.n_sent = 0
+
+    def update(self, batch):
+        rows = batch[key_columns(self.col_x, self.col_y, self.col_color)]
+        rows = rows.tail(self.max_rows)
+        window = rows if self.rows is None else pd.concat([self.rows, rows])
+        self.rows = window.tail(self.max_rows).reset_index(drop=True)
+        if self.n_sent + len(rows) > 2 * self.max_rows:
+            self.n_sent = len(self.rows)
+            return None
+        self.n_sent += len(rows)
+        return rows.reset_index(drop=True)
+
+    def table(self):
+        return self.rows
+
+    def spec(self):
+        if self.mark == "line":
+            mark = {"type": "line", "point": True, "tooltip": True}
+            encoding = {
+                "x": {"field": self.col_x, "type": "quantitative", "bin": True},
+                "y": {"field": self.col_y, "type": "quantitative", "aggregate": "mean"},
+            }
+        else:
+            mark = {"type": "circle", **CONFIG_MARK}
+            encoding = {
+                "x": {"field": self.col_x, "type": "quantitative"},
+                "y": {"field": self.col_y, "type": "quantitative"},
+            }
+        return {
+            **CONFIG_MAIN,
+            "mark": mark,
+            "encoding": {**encoding, **encoding_color(self.col_color)},
+        }
+
+
+if __name__ == "__main__":
+    # Demo feed, appends random rows every second: python -m src.live events.csv
+    path = LIVE_DIR / sys.argv[1]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(0)
+    while True:
+        n_rows = int(rng.integers(1, 100))
+        batch = pd.DataFrame(
+            {
+                "time": pd.Timestamp.now().floor("s"),
+                "sensor": rng.choice(["a", "b", "c"], n_rows),
+                "value": rng.normal(20, 5, n_rows).round(2),
+                "load": rng.uniform(0, 1, n_rows).round(3),
+            }
+        )
+        exists = path.exists() and path.stat().st_size > 0
+        batch.to_csv(path, mode="a", header=not exists, index=False)
+        time.sleep(1)
@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+from tornado.websocket import websocket_connect
+
+from src.backend import parquet_datasets
+from src.store import is_stored
+from src.upload import UPLOAD_DIR
+
+APP_PATH = Path(__file__).parent.parent / "app.py"
+LOADTEST_SESSIONS = 8
+LOADTEST_STEPS = 20
+LOADTEST_TIMEOUT = 120
+LABEL_DATASET = "Select a dataset"
+LABEL_VIEW = "Chart"
+# Interactions of a simulated user, once a dataset is selected: the view is switched
+# when needed, then widgets are found by key (or label when they have none) and set
+# to a random option of the current run
+ACTIONS = [
+    ("Bar", "bar_x"),
+    ("Bar", "bar_color"),
+    ("Histogram", "histo_x"),
+    ("Histogram", "histo_color"),
+    ("Histogram", "Bins"),
+    ("Time Series", "series_x"),
+    ("Time Series", "series_y"),
+    ("Boxplot", "box_x"),
+    ("Boxplot", "box_y"),
+    ("Scatter", "scatter_x"),
+    ("Scatter", "scatter_y"),
+    ("Donut Simple", "sdonut_color"),
+    ("Line", "line_x"),
+    ("Line", "line_y"),
+]
+PERCENTILES = [50, 95, 99]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, env=None):
+    # Offline: datasets must already be in the local store, nothing is downloaded
+    command = [
+        sys.executable,
+        "-m",
+        "streamlit",
+        "run",
+        str(APP_PATH),
+        "--server.headless=true",
+        f"--server.port={port}",
+        "--browser.gatherUsageStats=false",
+        "--server.fileWatcherType=none",
+        "--logger.level=error",
+    ]
+    env = {**os.environ, "VEGA_CHARTS_OFFLINE": "1", **(env or {})}
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+
+
+async def wait_ready(port, timeout=LOADTEST_TIMEOUT):
+    client = AsyncHTTPClient()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        # Endpoints under /_stcore since streamlit 1.18 (pinned in pyproject.toml), the
+        # server may answer with an error status while it starts
+        try:
+            await client.fetch(f"http://localhost:{port}/_stcore/health")
+            return
+        except (ConnectionError, OSError, HTTPClientError):
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"The app did not start within {timeout}s")
+
+
+def process_usage(pid):
+    # CPU seconds (user + system) and resident memory of a process, from /proc (Linux)
+    stat = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    cpu_s = (int(stat[11]) + int(stat[12])) / os.sysconf("SC_CLK_TCK")
+    rss_bytes = int(stat[21]) * os.sysconf("SC_PAGE_SIZE")
+    return cpu_s, rss_bytes
+
+
+class Session:
+    # One browser tab: reruns the script with its widget states over the websocket
+    # protocol of the Streamlit frontend, and keeps the widgets of the last run
+    def __init__(self, connection):
+        self.connection = connection
+        self.widgets = {}
+        self.states = {}
+        self.messages = {}
+        self.errors = []
+
+    async def rerun(self):
+        back_msg = BackMsg()
+        widget_states = back_msg.rerun_script.widget_states.widgets
+        widget_states.extend(self.states.values())
+        start = time.perf_counter()
+        await self.connection.write_message(back_msg.SerializeToString(), binary=True)
+
+        widgets = {}
+        while True:
+            data = await self.connection.read_message()
+            if data is None:
+                raise ConnectionError("The app closed the session")
+            msg = ForwardMsg.FromString(data)
+            if msg.WhichOneof("type") == "ref_hash":
+                msg = self.messages[msg.ref_hash]
+            elif msg.metadata.cacheable:
+                self.messages[msg.hash] = msg
+            if msg.WhichOneof("type") == "script_finished":
+                break
+            if msg.WhichOneof("type") == "delta":
+                self.read_delta(msg.delta, widgets)
+        latency = time.perf_counter() - start
+
+        self.widgets = widgets
+        self.states = {id: state for id, state in self.states.items() if id in widgets}
+        return latency
+
+    def read_delta(self, delta, widgets):
+        if delta.WhichOneof("type") != "new_element":
+            return
+        element = delta.new_element
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            self.errors.append(element.exception.message)
+        elif kind in ("selectbox", "radio", "slider"):
+            widget = getattr(element, kind)
+            widgets[widget.id] = (kind, widget)
+
+    def find(self, name):
+        # Widget ids end with their key, widgets without key are found by label
+        for id, (kind, widget) in self.widgets.items():
+            if id.endswith(f"-{name}") or widget.label == name:
+                return kind, widget
+        return None, None
+
+    def select(self, name, option=None, rng=random):
+        # Set a selectbox or radio to an option (random if not given) or a slider to a
+        # random value, returns False when there is nothing to change
+        kind, widget = self.find(name)
+        if kind is None:
+            return False
+        state = WidgetState(id=widget.id)
+        if kind in ("selectbox", "radio"):
+            options = [i for i, value in enumerate(widget.options) if value]
+            if option is not None:
+                options = [i for i in options if widget.options[i] == option]
+            # Already selected: the frontend would not rerun either
+            current = self.states.get(widget.id)
+            current = widget.default if current is None else current.int_value
+            if not options or options == [current]:
+                return False
+            state.int_value = rng.choice(options)
+        else:
+            state.double_array_value.data.append(
+                rng.randint(int(widget.min), int(widget.max))
+            )
+        self.states[widget.id] = state
+        return True
+
+
+async def run_session(url, dataset, n_steps, seed, latencies):
+    rng = random.Random(seed)
+    connection = await websocket_connect(url, max_message_size=2**30)
+    session = Session(connection)
+    try:
+        latencies.append(await session.rerun())
+        if not session.select(LABEL_DATASET, dataset):
+            raise ValueError(f"{dataset} is not one of the datasets of the app")
+        latencies.append(await session.rerun())
+        for _ in range(n_steps):
+            view, name = rng.choice(ACTIONS)
+            if session.select(LABEL_VIEW, view):
+                latencies.append(await session.rerun())
+            if session.select(name, rng=rng):
+                latencies.append(await session.rerun())
+        return session
+    except BaseException:
+        connection.close()
+        raise
+
+
+async def load_test(port, pid, dataset, n_sessions, n_steps, seed=0):
+    url = f"ws://localhost:{port}/_stcore/stream"
+    # Warm-up session: the dataset is prepared and cached once before measuring
+    warm_up = await run_session(url, dataset, 0, seed, [])
+    warm_up.connection.close()
+
+    latencies = []
+    cpu_before, rss_before = process_usage(pid)
+    start = time.perf_counter()
+    sessions = await asyncio.gather(
+        *[
+            run_session(url, dataset, n_steps, seed + i, latencies)
+            for i in range(1, n_sessions + 1)
+        ]
+    )
+    duration = time.perf_counter() - start
+    # Measured while every session is still open, as their state is kept in memory
+    cpu_after, rss_after = process_usage(pid)
+    for session in sessions:
+        session.connection.close()
+
+    percentiles = np.percentile(latencies, PERCENTILES) if latencies else []
+    return {
+        "dataset": dataset,
+        "sessions": n_sessions,
+        "steps": n_steps,
+        "reruns": len(latencies),
+        "duration_s": round(duration, 3),
+        "latency_s": {
+            **{f"p{p}": round(float(v), 4) for p, v in zip(PERCENTILES, percentiles)},
+            "max": round(max(latencies, default=0.0), 4),
+        },
+        "cpu_s": round(cpu_after - cpu_before, 3),
+        "cpu_s_per_rerun": round((cpu_after - cpu_before) / max(len(latencies), 1), 4),
+        "rss_bytes": rss_after,
+        "rss_bytes_per_session": (rss_after - rss_before) // n_sessions,
+        "errors": [error for session in sessions for error in session.errors],
+    }
+
+
+def is_local(dataset):
+    return (
+        is_stored(dataset)
+        or is_stored(dataset, UPLOAD_DIR)
+        or dataset in parquet_datasets()
+    )
+
+
+async def main(args):
+    port = free_port()
+    server = start_server(port)
+    try:
+        await wait_ready(port)
+        reports = []
+        for n_sessions in args.sessions:
+            report = await load_test(
+                port, server.pid, args.dataset, n_sessions, args.steps, args.seed
+            )
+            print(json.dumps(report), file=sys.stderr)
+            reports.append(report)
+        return reports
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    # e.g. python -m src.loadtest titanic --sessions 1 8 32 --output loadtest.json
+    parser = argparse.ArgumentParser(description="Load test app.py with N sessions")
+    parser.add_argument("dataset", help="Dataset already in the local store")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[LOADTEST_SESSIONS])
+    parser.add_argument("--steps", type=int, default=LOADTEST_STEPS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Report file (JSON), printed if not set")
+    args = parser.parse_args()
+    if not is_local(args.dataset):
+        sys.exit(f"{args.dataset} is not in the local store, load it first (no network)")
+
+    output = json.dumps(asyncio.run(main(args)), indent=1)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+from streamlit.type_util import data_frame_to_bytes
+
+from src.cache import RESULT_CACHE
+from src.store import STORE_DIR
+
+# Per-chart timings and payloads, off by default: when disabled, timed functions are
+# left undecorated and chart_metrics only checks this flag
+METRICS_ENABLED = os.environ.get("VEGA_CHARTS_METRICS", "0") not in ("", "0")
+METRICS_PATH = Path(
+    os.environ.get("VEGA_CHARTS_METRICS_PATH", STORE_DIR / "metrics.prom")
+)
+METRICS_PREFIX = "vega_charts"
+PHASES = ["aggregate", "spec", "serialize"]
+
+LOGGER = logging.getLogger(__name__)
+if METRICS_ENABLED and not LOGGER.handlers:
+    LOGGER.addHandler(logging.StreamHandler())
+    LOGGER.setLevel(logging.INFO)
+
+# Chart being rendered and charts of the current script run (one thread per session)
+CURRENT = threading.local()
+# Totals of the server process, per chart and dataset, exported to Prometheus
+TOTALS = defaultdict(lambda: defaultdict(float))
+TOTALS_LOCK = threading.Lock()
+
+
+def start_run(**labels):
+    # Called at the top of each script run, labels (e.g. dataset) tag its charts
+    CURRENT.labels = labels
+    CURRENT.records = []
+
+
+def run_records():
+    return list(getattr(CURRENT, "records", []))
+
+
+@contextmanager
+def phase(name):
+    # Time spent in this block, excluded from the enclosing phase (e.g. the aggregation
+    # done while building a spec), nested blocks of the same phase are counted once
+    record = getattr(CURRENT, "record", None)
+    parent = getattr(CURRENT, "phase", None)
+    if record is None or parent == name:
+        yield
+        return
+    CURRENT.phase = name
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        CURRENT.phase = parent
+        record[f"{name}_s"] += elapsed
+        if parent:
+            record[f"{parent}_s"] -= elapsed
+
+
+def timed(name):
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def update(**values):
+    record = getattr(CURRENT, "record", None)
+    if record is not None:
+        record.update(values)
+
+
+def add_payload(data, spec):
+    # Rows and bytes sent to the browser: Arrow data (inline or named datasets) + spec
+    record = getattr(CURRENT, "record", None)
+    if record is None:
+        return
+    frames = [data] if data is not None else []
+    frames += list(spec.get("datasets", {}).values())
+    spec = {key: value for key, value in spec.items() if key != "datasets"}
+    record["rows"] += sum(len(frame) for frame in frames)
+    record["bytes"] += len(json.dumps(spec, default=str))
+    record["bytes"] += sum(len(data_frame_to_bytes(frame)) for frame in frames)
+
+
+@contextmanager
+def chart_metrics(chart):
+    # Measures one chart render, then reports it to the logs, the run and the totals
+    # Charts plotted by another chart (e.g. scatter falling back to density) are
+    # measured as part of it
+    if not METRICS_ENABLED or getattr(CURRENT, "record", None) is not None:
+        yield
+        return
+    record = {
+        "chart": chart,
+        **getattr(CURRENT, "labels", {}),
+        "cache_hit": None,
+        **{f"{name}_s": 0.0 for name in PHASES},
+        "rows": 0,
+        "bytes": 0,
+    }
+    CURRENT.record, CURRENT.phase = record, None
+    try:
+        yield
+    finally:
+        CURRENT.record = None
+    report(record)
+
+
+def report(record):
+    LOGGER.info(json.dumps(record, default=str))
+    getattr(CURRENT, "records", []).append(record)
+
+    key = (record["chart"], record.get("dataset", ""))
+    with TOTALS_LOCK:
+        totals = TOTALS[key]
+        totals["renders"] += 1
+        totals["misses"] += record["cache_hit"] is False
+        for name in PHASES:
+            totals[f"{name}_s"] += record[f"{name}_s"]
+        totals["rows"] += record["rows"]
+        totals["bytes"] += record["bytes"]
+
+
+def label_values(**labels):
+    escaped = {
+        key: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for key, value in labels.items()
+    }
+    return ",".join(f'{key}="{value}"' for key, value in escaped.items())
+
+
+def prometheus_text():
+    lines = []
+
+    def metric(name, kind, description, samples):
+        lines.append(f"# HELP {METRICS_PREFIX}_{name} {description}")
+        lines.append(f"# TYPE {METRICS_PREFIX}_{name} {kind}")
+        for labels, value in samples:
+            labels = f"{{{label_values(**labels)}}}" if labels else ""
+            lines.append(f"{METRICS_PREFIX}_{name}{labels} {float(value)!r}")
+
+    with TOTALS_LOCK:
+        totals = {key: defaultdict(float, values) for key, values in TOTALS.items()}
+    for name, description in [
+        ("renders", "Charts rendered"),
+        ("misses", "Charts computed (missing from the result cache)"),
+    ]:
+        metric(
+            f"chart_{name}_total",
+            "counter",
+            description,
+            [
+                ({"chart": chart, "dataset": dataset}, values[name])
+                for (chart, dataset), values in totals.items()
+            ],
+        )
+    metric(
+        "chart_seconds_total",
+        "counter",
+        "Time spent rendering charts, by phase",
+        [
+            ({"chart": chart, "dataset": dataset, "phase": name}, values[f"{name}_s"])
+            for (chart, dataset), values in totals.items()
+            for name in PHASES
+        ],
+    )
+    for name, description in [("rows", "Rows sent"), ("bytes", "Bytes sent")]:
+        metric(
+            f"chart_{name}_total",
+            "counter",
+            f"{description} to the browser",
+            [
+                ({"chart": chart, "dataset": dataset}, values[name])
+                for (chart, dataset), values in totals.items()
+            ],
+        )
+
+    stats = RESULT_CACHE.stats()
+    for name in ("hits", "misses", "evictions"):
+        metric(
+            f"cache_{name}_total", "counter", f"Result cache {name}", [({}, stats[name])]
+        )
+    for name in ("entries", "bytes", "max_bytes"):
+        metric(f"cache_{name}", "gauge", f"Result cache {name}", [({}, stats[name])])
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path=METRICS_PATH):
+    # Text file for the Prometheus node exporter, replaced atomically
+    if not METRICS_ENABLED:
+        return
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path_tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    path_tmp.write_text(prometheus_text())
+    os.replace(path_tmp, path)
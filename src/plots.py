@@ -1,5 +1,45 @@
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
 import streamlit as st
 
+from src.aggregations import (
+    FIELD_AGG,
+    FIELD_BOX_LOWER,
+    FIELD_BOX_MEDIAN,
+    FIELD_BOX_Q1,
+    FIELD_BOX_Q3,
+    FIELD_BOX_UPPER,
+    agg_title,
+)
+from src.backend import as_backend
+from src.binning import (
+    FIELD_BIN_X,
+    FIELD_BIN_X_END,
+    FIELD_BIN_X_RANGE,
+    FIELD_BIN_Y,
+    FIELD_BIN_Y_END,
+    FIELD_BIN_Y_RANGE,
+    FIELD_COUNT,
+    FIELD_PERCENT,
+)
+from src.cache import RESULT_CACHE
+from src.metrics import add_payload, chart_metrics, phase, update
+from src.raster import (
+    FIELD_DENSITY,
+    FIELD_X,
+    FIELD_X_END,
+    FIELD_Y,
+    FIELD_Y_END,
+    RASTER_HEIGHT,
+    RASTER_MIN_ROWS,
+    RASTER_WIDTH,
+)
+from src.sampling import SCATTER_MAX_POINTS
+from src.spec import concat_specs, project
+from src.timebuckets import field_agg
+
 CONFIG_MAIN = {
     "width": 600,
     "height": 400,
@@ -13,9 +53,96 @@ CONFIG_MARK = {
     "strokeWidth": 0.5,
 }
 
-ATT_DATA_NUM_GROUP = "datum.groupcount/datum.total"
+CONFIG_CAPTION = {
+    "anchor": "end",
+    "fontSize": 11,
+    "fontWeight": "normal",
+}
+
+CONFIG_GROUP_TITLE = {
+    "anchor": "start",
+    "fontSize": 18,
+}
+
+# Above this number of rows, charts aggregate server-side instead of in the browser
+PREAGGREGATE_MIN_ROWS = 100_000
+
+
+def use_preaggregate(df, preaggregate):
+    # Query backends (out-of-core datasets) can only send aggregated data
+    if not as_backend(df).in_memory:
+        return True
+    return len(df) >= PREAGGREGATE_MIN_ROWS if preaggregate is None else preaggregate
+
+
+# Charts collected by the chart group of the current script run (one thread per session)
+ACTIVE_GROUP = threading.local()
+
+
+def draw(data, spec):
+    # Streamlit serializes data (Arrow) and spec (JSON) for the browser here
+    with phase("serialize"):
+        st.vega_lite_chart(data=data, spec=spec)
+    add_payload(data, spec)
+
+
+def vega_lite_chart(data, spec):
+    charts = getattr(ACTIVE_GROUP, "charts", None)
+    if charts is not None:
+        charts.append((data, spec))
+    else:
+        draw(project(data, spec), spec)
+
+
+@contextmanager
+def record_charts():
+    # Collect the (data, spec) charts plotted in this block instead of drawing them
+    previous = getattr(ACTIVE_GROUP, "charts", None)
+    ACTIVE_GROUP.charts = charts = []
+    try:
+        yield charts
+    finally:
+        ACTIVE_GROUP.charts = previous
+
+
+@contextmanager
+def chart_group(titles=()):
+    # Charts plotted in this block are drawn as one Vega-Lite chart, where charts built
+    # from the same frame reference a single named dataset, serialized only once
+    with record_charts() as charts:
+        yield
+    if charts:
+        with chart_metrics("chart_group"):
+            draw(None, concat_specs(charts, titles, CONFIG_GROUP_TITLE))
+
 
+def cached_chart(plot):
+    # Charts are computed once per dataset version and arguments, then shared by every
+    # session through the result cache (prepared datasets are not counted in its size)
+    @wraps(plot)
+    def wrapper(df, *args, **kwargs):
+        key = (
+            plot.__name__,
+            as_backend(df).fingerprint,
+            args,
+            tuple(sorted(kwargs.items())),
+        )
 
+        def compute():
+            update(cache_hit=False)
+            with record_charts() as charts, phase("spec"):
+                plot(df, *args, **kwargs)
+            return tuple(charts)
+
+        with chart_metrics(plot.__name__):
+            update(cache_hit=True)
+            for data, spec in RESULT_CACHE.get(key, compute):
+                vega_lite_chart(data, spec)
+
+    return wrapper
+
+
+@cached_chart
 def plot_bar(
     df,
     col_x,
@@ -24,6 +151,7 @@ def plot_bar(
     agg=None,
     norm=False,
     group=False,
+    preaggregate=None,
 ):
     config_norm = (
         {
@@ -37,7 +165,12 @@ def plot_bar(
 
     config_group = {"xOffset": {"field": col_color}} if group else {}
 
-    st.vega_lite_chart(
+    config_y = {"field": col_y, "aggregate": agg}
+    if use_preaggregate(df, preaggregate):
+        df = as_backend(df).aggregate_bar(col_x, col_y, col_color, agg=agg, norm=norm)
+        config_y = {"field": FIELD_AGG, "title": agg_title(agg, col_y)}
+
+    vega_lite_chart(
         data=df,
         spec={
             **CONFIG_MAIN,
@@ -49,9 +182,8 @@ def plot_bar(
                     "axis": {"labelAngle": 0},
                 },
                 "y": {
-                    "field": col_y,
+                    **config_y,
                     "type": "quantitative",
-                    "aggregate": agg,
                     **config_norm,
                 },
                 "color": {
@@ -65,6 +197,7 @@ def plot_bar(
 
 
 # TODO: Add 2D count view
+@cached_chart
 def plot_timeseries(
     df,
     mark,
@@ -74,6 +207,7 @@ def plot_timeseries(
     col_color=None,
     agg=None,
     norm=False,
+    preaggregate=None,
 ):
     config_norm = (
         {"stack": "normalize", "format": ".1%", "axis": {"format": ".1%"}}
@@ -90,22 +224,29 @@ def plot_timeseries(
         }
     )
 
-    st.vega_lite_chart(
+    label_angle = -45 if len(df) > 20 else 0
+    # Naive timestamps are sent as UTC instants: UTC time units give back their own
+    # date parts, as the pre-aggregated buckets, whatever the timezone of the browser
+    config_x = {"field": col_x, "timeUnit": f"utc{unit}"}
+    config_y = {"field": col_y, "aggregate": agg}
+    if use_preaggregate(df, preaggregate):
+        df = as_backend(df).time_buckets(col_x, [unit], col_y, col_color)
+        config_y = {"field": field_agg(agg), "title": agg_title(agg, col_y)}
+
+    vega_lite_chart(
         data=df,
         spec={
             **CONFIG_MAIN,
             "mark": {"type": mark, **config_mark},
             "encoding": {
                 "x": {
-                    "field": col_x,
+                    **config_x,
                     "type": "ordinal",
-                    "timeUnit": unit,
-                    "axis": {"labelAngle": -45 if len(df) > 20 else 0},
+                    "axis": {"labelAngle": label_angle},
                 },
                 "y": {
-                    "field": col_y,
+                    **config_y,
                     "type": "quantitative",
-                    "aggregate": agg,
                     **config_norm,
                 },
                 "color": {
@@ -117,6 +258,7 @@ def plot_timeseries(
     )
 
 
+@cached_chart
 def plot_series_heatmap(
     df,
     col_date,
@@ -124,8 +266,17 @@ def plot_series_heatmap(
     agg="mean",
     unit_x="date",
     unit_y="month",
+    preaggregate=None,
 ):
-    st.vega_lite_chart(
+    # UTC time units on both paths, as in plot_timeseries
+    config_x = {"field": col_date, "timeUnit": f"utc{unit_x}"}
+    config_y = {"field": col_date, "timeUnit": f"utc{unit_y}"}
+    config_color = {"field": col_color, "aggregate": agg}
+    if use_preaggregate(df, preaggregate):
+        df = as_backend(df).time_buckets(col_date, [unit_x, unit_y], col_color)
+        config_color = {"field": field_agg(agg)}
+
+    vega_lite_chart(
         data=df,
         spec={
             "config": {
@@ -139,20 +290,17 @@ def plot_series_heatmap(
             "mark": {"type": "rect", "tooltip": True},
             "encoding": {
                 "x": {
-                    "field": col_date,
-                    "timeUnit": unit_x,
+                    **config_x,
                     "type": "ordinal",
                     "title": unit_x.capitalize(),
                 },
                 "y": {
-                    "field": col_date,
-                    "timeUnit": unit_y,
+                    **config_y,
                     "type": "ordinal",
                     "title": unit_y.capitalize(),
                 },
                 "color": {
-                    "field": col_color,
-                    "aggregate": agg,
+                    **config_color,
                     "type": "quantitative",
                     "legend": {"title": col_color.capitalize()},
                 },
@@ -161,6 +309,7 @@ def plot_series_heatmap(
     )
 
 
+@cached_chart
 def plot_histo(
     df,
     col_x,
@@ -169,6 +318,7 @@ def plot_histo(
     bin=None,
     layered=False,
     normalize=False,
+    preaggregate=None,
 ):
     config_bin = {"maxbins": bin} if bin else True
     config_params = (
@@ -197,37 +347,61 @@ def plot_histo(
         if layered
         else {}
     )
-    st.vega_lite_chart(
+    config_transform = (
+        [
+            {"filter": f"datum.{col_x} != null"},  # Ignore NaNs
+            {"bin": config_bin, "field": col_x, "as": "bin_col_x"},
+            {
+                "aggregate": [{"op": "count", "as": "xCount"}],
+                "groupby": ["bin_col_x", "bin_col_x_end"],
+            },
+            {"joinaggregate": [{"op": "sum", "field": "xCount", "as": "TotalCount"}]},
+            {"calculate": "datum.xCount/datum.TotalCount", "as": "PercentOfTotal"},
+        ]
+        if normalize
+        else []
+    )
+    config_x = {
+        "field": "bin_col_x" if normalize else col_x,
+        "bin": {"maxbins": bin, "binned": True} if normalize else config_bin,
+    }
+    config_x2 = {"field": "bin_col_x_end"} if normalize else {}
+    config_y = {
+        "field": "PercentOfTotal" if normalize else None,
+        "aggregate": None if normalize else "count",
+    }
+
+    if use_preaggregate(df, preaggregate):
+        df, step = as_backend(df).histogram(
+            col_x, col_color, maxbins=bin, normalize=normalize
+        )
+        config_transform = []
+        config_x = (
+            {"field": FIELD_BIN_X_RANGE, "sort": {"field": FIELD_BIN_X, "op": "min"}}
+            if ordinal
+            else {"field": FIELD_BIN_X, "bin": {"binned": True, "step": step}}
+        )
+        config_x2 = {} if ordinal else {"field": FIELD_BIN_X_END}
+        config_y = {"field": FIELD_PERCENT if normalize else FIELD_COUNT}
+
+    vega_lite_chart(
         data=df,
         spec={
             **CONFIG_MAIN,
             "mark": {"type": "bar", **CONFIG_MARK, "blend": "normal", "binSpacing": 0},
             "params": config_params,
-            "transform": [
-                {"filter": f"datum.{col_x} != null"},  # Ignore NaNs
-                {"bin": config_bin, "field": col_x, "as": "bin_col_x"},
-                {
-                    "aggregate": [{"op": "count", "as": "xCount"}],
-                    "groupby": ["bin_col_x", "bin_col_x_end"],
-                },
-                {"joinaggregate": [{"op": "sum", "field": "xCount", "as": "TotalCount"}]},
-                {"calculate": "datum.xCount/datum.TotalCount", "as": "PercentOfTotal"},
-            ]
-            if normalize
-            else [],
+            "transform": config_transform,
             "encoding": {
                 "x": {
-                    "field": "bin_col_x" if normalize else col_x,
+                    **config_x,
                     "type": "ordinal" if ordinal else "quantitative",
                     "axis": {"labelAngle": -45 if ordinal else 0},
-                    "bin": {"maxbins": bin, "binned": True} if normalize else config_bin,
                     "title": col_x.capitalize(),
                 },
-                "x2": {"field": "bin_col_x_end"} if normalize else {},
+                "x2": config_x2,
                 "y": {
-                    "field": "PercentOfTotal" if normalize else None,
+                    **config_y,
                     "type": "quantitative",
-                    "aggregate": None if normalize else "count",
                     "title": "Relative Frequency" if normalize else "Count",
                     "stack": None if layered else "zero",
                     "axis": {"format": ".1~%"} if normalize else {},
@@ -239,8 +413,53 @@ def plot_histo(
     )
 
 
-def plot_2d_histo(df, mark, col_x, col_y, bin_x, bin_y, ordinal):
-    st.vega_lite_chart(
+@cached_chart
+def plot_2d_histo(
+    df,
+    mark,
+    col_x,
+    col_y,
+    bin_x,
+    bin_y,
+    ordinal,
+    preaggregate=None,
+    raster=False,
+):
+    if raster and mark == "circle":
+        plot_density(df, col_x, col_y)
+        return
+
+    config_x = {"field": col_x, "bin": {"maxbins": bin_x}}
+    config_x2 = {}
+    config_y = {"field": col_y, "bin": {"maxbins": bin_y}, "sort": "-y"}
+    config_y2 = {}
+    config_count = {"aggregate": "count"}
+
+    if use_preaggregate(df, preaggregate):
+        df, step_x, step_y = as_backend(df).histogram_2d(
+            col_x, col_y, bin_x=bin_x, bin_y=bin_y
+        )
+        if ordinal:
+            config_x = {
+                "field": FIELD_BIN_X_RANGE,
+                "sort": {"field": FIELD_BIN_X, "op": "min"},
+            }
+            config_y = {
+                "field": FIELD_BIN_Y_RANGE,
+                "sort": {"field": FIELD_BIN_Y, "op": "min", "order": "descending"},
+            }
+        else:
+            config_x = {"field": FIELD_BIN_X, "bin": {"binned": True, "step": step_x}}
+            config_x2 = {"field": FIELD_BIN_X_END}
+            config_y = {"field": FIELD_BIN_Y, "bin": {"binned": True, "step": step_y}}
+            config_y2 = {"field": FIELD_BIN_Y_END}
+        config_count = {
+            "field": FIELD_COUNT,
+            "type": "quantitative",
+            "title": agg_title("count"),
+        }
+
+    vega_lite_chart(
         data=df,
         spec={
             **CONFIG_MAIN,
@@ -257,56 +476,145 @@ def plot_2d_histo(df, mark, col_x, col_y, bin_x, bin_y, ordinal):
             "mark": {"type": mark, "tooltip": True},
             "encoding": {
                 "x": {
-                    "field": col_x,
-                    "bin": {"maxbins": bin_x},
+                    **config_x,
                     "title": col_x.capitalize(),
                     "type": "ordinal" if ordinal else "quantitative",
                 },
+                "x2": config_x2,
                 "y": {
-                    "field": col_y,
-                    "bin": {"maxbins": bin_y},
+                    **config_y,
                     "title": col_y.capitalize(),
                     "type": "ordinal" if ordinal else "quantitative",
-                    "sort": "-y",
                 },
-                "size": {"aggregate": "count"},
-                "color": {"aggregate": "count"} if mark == "rect" else {},
+                "y2": config_y2,
+                "size": config_count,
+                "color": config_count if mark == "rect" else {},
             },
         },
     )
 
 
-def plot_box(df, col_x, col_y, col_color, zero):
-    st.vega_lite_chart(
+@cached_chart
+def plot_box(df, col_x, col_y, col_color, zero, preaggregate=None, approximate=False):
+    config_x = {
+        "field": col_x,
+        "type": "ordinal",
+        "title": col_x.capitalize(),
+        "axis": {"labelAngle": 0},
+    }
+    config_y = {
+        "type": "quantitative",
+        "title": col_y.capitalize(),
+        "scale": {"zero": zero},
+    }
+    config_color = {
+        "field": col_color,
+        "type": "nominal",
+        "title": col_color.capitalize(),
+    }
+
+    if not use_preaggregate(df, preaggregate):
+        vega_lite_chart(
+            data=df,
+            spec={
+                **CONFIG_MAIN,
+                "mark": {"type": "boxplot", "ticks": True, **CONFIG_MARK},
+                "encoding": {
+                    "x": config_x,
+                    "y": {"field": col_y, **config_y},
+                    "color": config_color,
+                    "size": {"value": 30},
+                },
+            },
+        )
+        return
+
+    # Same visual as the boxplot composite mark, drawn from the summary table
+    df = as_backend(df).box_stats(col_x, col_y, col_color, approximate=approximate)
+    filter_summary = {"filter": f"isValid(datum.{FIELD_BOX_Q1})"}
+    vega_lite_chart(
         data=df,
         spec={
             **CONFIG_MAIN,
-            "mark": {"type": "boxplot", "ticks": True, **CONFIG_MARK},
-            "encoding": {
-                "x": {
-                    "field": col_x,
-                    "type": "ordinal",
-                    "title": col_x.capitalize(),
-                    "axis": {"labelAngle": 0},
+            "encoding": {"x": config_x},
+            "layer": [
+                # Whiskers
+                {
+                    "mark": {"type": "rule", "color": "black"},
+                    "transform": [filter_summary],
+                    "encoding": {
+                        "y": {"field": FIELD_BOX_LOWER, **config_y},
+                        "y2": {"field": FIELD_BOX_UPPER},
+                    },
                 },
-                "y": {
-                    "field": col_y,
-                    "type": "quantitative",
-                    "title": col_y.capitalize(),
-                    "scale": {"zero": zero},
+                *[
+                    {
+                        "mark": {"type": "tick", "color": "black", "size": 30},
+                        "transform": [filter_summary],
+                        "encoding": {"y": {"field": field, **config_y}},
+                    }
+                    for field in [FIELD_BOX_LOWER, FIELD_BOX_UPPER]
+                ],
+                # Box
+                {
+                    "mark": {"type": "bar", **CONFIG_MARK},
+                    "transform": [filter_summary],
+                    "encoding": {
+                        "y": {"field": FIELD_BOX_Q1, **config_y},
+                        "y2": {"field": FIELD_BOX_Q3},
+                        "color": config_color,
+                        "size": {"value": 30},
+                        "tooltip": [
+                            {"field": col_x, "title": col_x.capitalize()},
+                            {
+                                "field": FIELD_BOX_UPPER,
+                                "title": f"Upper Whisker of {col_y}",
+                            },
+                            {"field": FIELD_BOX_Q3, "title": f"Q3 of {col_y}"},
+                            {"field": FIELD_BOX_MEDIAN, "title": f"Median of {col_y}"},
+                            {"field": FIELD_BOX_Q1, "title": f"Q1 of {col_y}"},
+                            {
+                                "field": FIELD_BOX_LOWER,
+                                "title": f"Lower Whisker of {col_y}",
+                            },
+                        ],
+                    },
                 },
-                "color": {
-                    "field": col_color,
-                    "type": "nominal",
-                    "title": col_color.capitalize(),
+                # Median
+                {
+                    "mark": {"type": "tick", "color": "white", "size": 30},
+                    "transform": [filter_summary],
+                    "encoding": {"y": {"field": FIELD_BOX_MEDIAN, **config_y}},
                 },
-                "size": {"value": 30},
-            },
+                # Outliers
+                {
+                    "mark": {"type": "point", "tooltip": True},
+                    "transform": [{"filter": f"!isValid(datum.{FIELD_BOX_Q1})"}],
+                    "encoding": {
+                        "y": {"field": col_y, **config_y},
+                        "color": config_color,
+                    },
+                },
+            ],
         },
     )
 
 
-def plot_scatter(df, mark, col_x, col_y, col_color=None):
+@cached_chart
+def plot_scatter(
+    df,
+    mark,
+    col_x,
+    col_y,
+    col_color=None,
+    max_points=SCATTER_MAX_POINTS,
+    seed=0,
+    raster=None,
+):
+    if raster or (raster is None and len(df) >= RASTER_MIN_ROWS):
+        plot_density(df, col_x, col_y, col_color)
+        return
+
     config_params = (
         [
             {
@@ -330,10 +638,24 @@ def plot_scatter(df, mark, col_x, col_y, col_color=None):
         else {}
     )
 
-    st.vega_lite_chart(
+    config_title = {}
+    backend = as_backend(df)
+    if not backend.in_memory or (max_points and len(df) > max_points):
+        budget = max_points or len(backend)
+        df, n_total = backend.sample(col_x, col_y, col_color, budget, seed)
+        if len(df) < n_total:
+            config_title = {
+                "title": {
+                    "text": f"Showing {len(df):,} of {n_total:,} points",
+                    **CONFIG_CAPTION,
+                }
+            }
+
+    vega_lite_chart(
         data=df,
         spec={
             **CONFIG_MAIN,
+            **config_title,
             "mark": {"type": mark, "tooltip": True},
             "params": config_params,
             "encoding": {
@@ -358,28 +680,94 @@ def plot_scatter(df, mark, col_x, col_y, col_color=None):
     )
 
 
-def plot_donut_simple(df, col_color):
-    st.vega_lite_chart(
+@cached_chart
+def plot_density(
+    df,
+    col_x,
+    col_y,
+    col_color=None,
+    width=RASTER_WIDTH,
+    height=RASTER_HEIGHT,
+):
+    df, n_total = as_backend(df).rasterize(
+        col_x, col_y, col_color, width=width, height=height
+    )
+    config_density = {
+        "field": FIELD_DENSITY,
+        "type": "quantitative",
+        "scale": {"type": "log"},
+        "title": agg_title("count"),
+    }
+    config_params = (
+        [
+            {
+                "name": "select",
+                "select": {"type": "point", "fields": [col_color]},
+                "bind": "legend",
+            },
+        ]
+        if col_color
+        else []
+    )
+    config_color = (
+        {
+            "color": {
+                "field": col_color,
+                "type": "nominal",
+                "title": col_color.capitalize(),
+            },
+            "opacity": {
+                "condition": {
+                    "param": "select",
+                    **config_density,
+                    "scale": {"type": "log", "range": [0.2, 1]},
+                    "legend": None,
+                },
+                "value": 0.05,
+            },
+        }
+        if col_color
+        else {"color": config_density}
+    )
+
+    vega_lite_chart(
         data=df,
         spec={
             **CONFIG_MAIN,
-            "mark": {"type": "arc", "innerRadius": 100, **CONFIG_MARK},
-            "transform": [
-                {
-                    "window": [{"op": "count", "as": "total"}],
-                    "frame": [None, None],
+            "title": {"text": f"Density of {n_total:,} points", **CONFIG_CAPTION},
+            "mark": {"type": "rect", "tooltip": True},
+            "params": config_params,
+            "encoding": {
+                "x": {
+                    "field": FIELD_X,
+                    "type": "quantitative",
+                    "title": col_x.capitalize(),
                 },
-                {
-                    "joinaggregate": [{"op": "count", "as": "groupcount"}],
-                    "groupby": [col_color],
+                "x2": {"field": FIELD_X_END},
+                "y": {
+                    "field": FIELD_Y,
+                    "type": "quantitative",
+                    "title": col_y.capitalize(),
                 },
-                {"calculate": ATT_DATA_NUM_GROUP, "as": "share"},
-            ],
+                "y2": {"field": FIELD_Y_END},
+                **config_color,
+            },
+        },
+    )
+
+
+@cached_chart
+def plot_donut_simple(df, col_color):
+    vega_lite_chart(
+        data=as_backend(df).donut_counts(col_color),
+        spec={
+            **CONFIG_MAIN,
+            "mark": {"type": "arc", "innerRadius": 100, **CONFIG_MARK},
             "encoding": {
                 "theta": {
+                    "field": "groupcount",
                     "type": "quantitative",
                     "title": "Count",
-                    "aggregate": "count",
                 },
                 "color": {
                     "field": col_color,
@@ -398,9 +786,10 @@ def plot_donut_simple(df, col_color):
     )
 
 
+@cached_chart
 def plot_donut_complex(df, col_color_1, col_color_2):
-    st.vega_lite_chart(
-        data=df,
+    vega_lite_chart(
+        data=as_backend(df).donut_counts(col_color_1, col_color_2),
         spec={
             **CONFIG_MAIN,
             "layer": [
@@ -412,22 +801,12 @@ def plot_donut_complex(df, col_color_1, col_color_2):
                         "outerRadius": 125,
                         **CONFIG_MARK,
                     },
-                    "transform": [
-                        {
-                            "window": [{"op": "count", "as": "total"}],
-                            "frame": [None, None],
-                        },
-                        {
-                            "joinaggregate": [{"op": "count", "as": "groupcount"}],
-                            "groupby": [col_color_1],
-                        },
-                        {"calculate": "datum.groupcount/datum.total", "as": "share"},
-                    ],
                     "encoding": {
                         "theta": {
+                            "field": "groupcount2",
                             "type": "quantitative",
                             "title": "Count",
-                            "aggregate": "count",
+                            "aggregate": "sum",
                         },
                         "color": {
                             "field": col_color_1,
@@ -449,22 +828,12 @@ def plot_donut_complex(df, col_color_1, col_color_2):
                         "outerRadius": 160,
                         **CONFIG_MARK,
                     },
-                    "transform": [
-                        {
-                            "window": [{"op": "count", "as": "total"}],
-                            "frame": [None, None],
-                        },
-                        {
-                            "joinaggregate": [{"op": "count", "as": "groupcount2"}],
-                            "groupby": [col_color_1, col_color_2],
-                        },
-                        {"calculate": "datum.groupcount2/datum.total", "as": "share2"},
-                    ],
                     "encoding": {
                         "theta": {
+                            "field": "groupcount2",
                             "type": "quantitative",
                             "title": "Count",
-                            "aggregate": "count",
+                            "aggregate": "sum",
                             "sort": "descending",
                         },
                         # Apply same color as col_color_1 but with gradient
@@ -489,8 +858,12 @@ def plot_donut_complex(df, col_color_1, col_color_2):
     )
 
 
+@cached_chart
 def plot_line(df, col_x, col_y, col_color):
-    st.vega_lite_chart(
+    backend = as_backend(df)
+    if not backend.in_memory:
+        df, _ = backend.sample(col_x, col_y, col_color)
+    vega_lite_chart(
         data=df,
         spec={
             **CONFIG_MAIN,
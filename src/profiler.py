@@ -0,0 +1,140 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+from pandas.api import types
+from pandas.tseries.api import guess_datetime_format
+
+from src.backend import as_backend
+
+# Numeric columns with more distinct values are continuous, others are categorical
+CARDINALITY_THRESHOLD = int(os.environ.get("VEGA_CHARTS_CARDINALITY_THRESHOLD", 20))
+# Above this number of rows, distinct values are estimated with HyperLogLog
+EXACT_DISTINCT_MAX_ROWS = 1_000_000
+# 2**14 registers: ~0.8% standard error, hashed by chunks of rows
+HLL_PRECISION = 14
+HLL_CHUNK = 1_000_000
+# String columns are datetimes when most values of a sample parse with the same format
+DATETIME_SAMPLE = 1_000
+DATETIME_MIN_SHARE = 0.95
+KINDS = ["num", "cat", "datetime"]
+
+
+def hll_update(registers, hashes, precision=HLL_PRECISION):
+    # Register of each hash (first bits) keeps the max rank of its first 1 bit in the rest
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes << np.uint64(precision)
+    bit_length = np.zeros(len(rest), dtype=np.int64)
+    nonzero = rest > 0
+    bit_length[nonzero] = np.log2(rest[nonzero].astype(float)).astype(np.int64) + 1
+    rank = np.minimum(64 - bit_length + 1, 64 - precision + 1)
+    np.maximum.at(registers, index, rank)
+
+
+def hll_estimate(registers):
+    n_registers = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / n_registers)
+    estimate = alpha * n_registers**2 / np.sum(2.0 ** -registers.astype(float))
+    n_zeros = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * n_registers and n_zeros:
+        # Small range correction (linear counting)
+        estimate = n_registers * np.log(n_registers / n_zeros)
+    return int(round(estimate))
+
+
+def approx_distinct(series, precision=HLL_PRECISION, chunk=HLL_CHUNK):
+    registers = np.zeros(2**precision, dtype=np.int64)
+    for start in range(0, len(series), chunk):
+        end = start + chunk
+        values = series.iloc[start:end].dropna().to_numpy()
+        hll_update(registers, pd.util.hash_array(values), precision)
+    return hll_estimate(registers)
+
+
+def count_distinct(series):
+    # Returns the number of distinct values (nulls excluded), and if it is an estimate
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        return int(np.count_nonzero(np.bincount(codes[codes >= 0]))), False
+    if len(series) <= EXACT_DISTINCT_MAX_ROWS:
+        return int(series.nunique()), False
+    return approx_distinct(series), True
+
+
+def datetime_format(series, n_sample=DATETIME_SAMPLE):
+    # Format parsing most values of an evenly spaced sample, None if they are not dates
+    is_string = types.is_object_dtype(series) or types.is_string_dtype(series)
+    if not is_string or series.empty:
+        return None
+    positions = np.unique(np.linspace(0, len(series) - 1, n_sample).astype(np.int64))
+    values = series.iloc[positions].dropna().astype(str)
+    # Numbers are not dates, even when a format can parse them (e.g. years)
+    if values.empty or pd.to_numeric(values, errors="coerce").notna().all():
+        return None
+
+    # Ambiguous dates (e.g. 01/02/2020) are tried month first, then day first (pandas
+    # warns when a day first guess is not, e.g. for ISO dates)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        formats = dict.fromkeys(
+            guess_datetime_format(value, dayfirst=dayfirst)
+            for dayfirst in (False, True)
+            for value in values.iloc[:5]
+        )
+    for fmt in filter(None, formats):
+        parsed = pd.to_datetime(values, format=fmt, errors="coerce")
+        if parsed.notna().mean() >= DATETIME_MIN_SHARE:
+            return fmt
+    return None
+
+
+def column_kind(dtype, n_distinct, threshold=CARDINALITY_THRESHOLD):
+    if types.is_datetime64_any_dtype(dtype):
+        return "datetime"
+    if types.is_numeric_dtype(dtype) and not types.is_bool_dtype(dtype):
+        return "num" if n_distinct is None or n_distinct > threshold else "cat"
+    return "cat"
+
+
+def profile_columns(df, threshold=CARDINALITY_THRESHOLD):
+    # Kind of each column (continuous, categorical or datetime) + distinct counts, the
+    # lists of columns per kind are kept at the top level ("num", "cat", "datetime")
+    backend = as_backend(df)
+    columns = {}
+    if backend.in_memory:
+        for col in backend.df.columns:
+            series = backend.df[col]
+            fmt = datetime_format(series)
+            n_distinct, approximate = count_distinct(series)
+            dtype = "datetime64[ns]" if fmt else series.dtype
+            columns[col] = {
+                "kind": column_kind(dtype, n_distinct, threshold),
+                "dtype": str(dtype),
+                "distinct": n_distinct,
+                "approximate": approximate,
+                **({"format": fmt} if fmt else {}),
+            }
+    else:
+        # Query backends estimate distinct values themselves, strings are left as is
+        schema = backend.head(0)
+        distinct = backend.nunique(list(schema.columns))
+        for col, dtype in schema.dtypes.items():
+            columns[col] = {
+                "kind": column_kind(dtype, distinct[col], threshold),
+                "dtype": str(dtype),
+                "distinct": distinct[col],
+                "approximate": True,
+            }
+
+    kinds = {
+        kind: [c for c, info in columns.items() if info["kind"] == kind] for kind in KINDS
+    }
+    return {**kinds, "columns": columns}
+
+
+def parse_datetimes(df, profile):
+    # Convert in place the string columns detected as datetimes (invalid values are NaT)
+    for col, info in profile["columns"].items():
+        if "format" in info:
+            df[col] = pd.to_datetime(df[col], format=info["format"], errors="coerce")
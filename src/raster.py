@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+# Pixel grid of the density raster (chart is 600x400, so 4x4 pixels per cell)
+RASTER_WIDTH = 150
+RASTER_HEIGHT = 100
+# Above this number of rows, scatter plots are rendered as a density raster
+RASTER_MIN_ROWS = 2_000_000
+# Rows converted to NumPy at once, so large columns are never copied as a whole
+RASTER_CHUNK = 1_000_000
+
+FIELD_X = "_x"
+FIELD_X_END = "_x_end"
+FIELD_Y = "_y"
+FIELD_Y_END = "_y_end"
+FIELD_DENSITY = "_count"
+
+
+def cell_index(values, vmin, span, n_cells):
+    return np.minimum(((values - vmin) / span * n_cells).astype(np.int64), n_cells - 1)
+
+
+def sum_counts(keys, counts):
+    # Counts summed per distinct key (sorted)
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=counts, minlength=len(keys)).astype(
+        np.int64
+    )
+
+
+def rasterize(
+    df,
+    col_x,
+    col_y,
+    col_color=None,
+    width=RASTER_WIDTH,
+    height=RASTER_HEIGHT,
+    chunk=RASTER_CHUNK,
+):
+    # Count points per pixel (and per color), keeping the dominant color of each pixel
+    x_min, x_max = df[col_x].min(), df[col_x].max()
+    y_min, y_max = df[col_y].min(), df[col_y].max()
+    span_x, span_y = (x_max - x_min) or 1, (y_max - y_min) or 1
+
+    categories = None
+    if col_color:
+        codes, categories = pd.factorize(df[col_color], use_na_sentinel=False)
+    n_pixels = width * height
+    # Sparse counts of the (color, pixel) pairs found, as few as the pixels drawn even
+    # for colors with many categories
+    keys = np.zeros(0, dtype=np.int64)
+    counts = np.zeros(0, dtype=np.int64)
+
+    for start in range(0, len(df), chunk):
+        end = start + chunk
+        values_x = df[col_x].iloc[start:end].to_numpy(dtype=float, na_value=np.nan)
+        values_y = df[col_y].iloc[start:end].to_numpy(dtype=float, na_value=np.nan)
+        valid = ~(np.isnan(values_x) | np.isnan(values_y))
+        pixels = cell_index(values_y[valid], y_min, span_y, height) * width
+        pixels += cell_index(values_x[valid], x_min, span_x, width)
+        if col_color:
+            pixels += codes[start:end][valid].astype(np.int64) * n_pixels
+        chunk_keys, chunk_counts = np.unique(pixels, return_counts=True)
+        keys, counts = sum_counts(
+            np.concatenate([keys, chunk_keys]), np.concatenate([counts, chunk_counts])
+        )
+
+    bounds = (x_min, span_x, y_min, span_y)
+    return raster_table(keys, counts, bounds, width, height, col_color, categories)
+
+
+def raster_table(keys, counts, bounds, width, height, col_color=None, categories=None):
+    # keys: color code * n_pixels + pixel, pixels numbered row by row from the bottom,
+    # counts: points per key
+    x_min, span_x, y_min, span_y = bounds
+    keys, counts = sum_counts(keys, counts)
+    codes, pixel_keys = np.divmod(keys, width * height)
+    pixels, inverse = np.unique(pixel_keys, return_inverse=True)
+    total = np.bincount(inverse, weights=counts, minlength=len(pixels)).astype(np.int64)
+    idx_y, idx_x = np.divmod(pixels, width)
+
+    table = pd.DataFrame(
+        {
+            FIELD_X: x_min + idx_x * span_x / width,
+            FIELD_X_END: x_min + (idx_x + 1) * span_x / width,
+            FIELD_Y: y_min + idx_y * span_y / height,
+            FIELD_Y_END: y_min + (idx_y + 1) * span_y / height,
+            FIELD_DENSITY: total,
+        }
+    )
+    if col_color:
+        # Per pixel, the most frequent color (the first one on ties)
+        order = np.lexsort((codes, -counts, inverse))
+        first = np.flatnonzero(np.diff(inverse[order], prepend=-1))
+        table[col_color] = categories.take(codes[order[first]])
+    return table, int(total.sum())
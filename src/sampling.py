@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from src.fingerprint import get_fingerprint
+
+# Default number of points sent to the browser by scatter plots
+SCATTER_MAX_POINTS = 50_000
+# Share of the budget reserved to the extreme values of each axis
+EXTREME_SHARE = 0.05
+
+
+def extreme_rows(values, n_extremes):
+    n_extremes = min(n_extremes, len(values) // 2)
+    if not n_extremes:
+        return np.empty(0, dtype=np.int64)
+    order = np.argpartition(values, [n_extremes - 1, len(values) - n_extremes])
+    return np.concatenate([order[:n_extremes], order[-n_extremes:]])
+
+
+def stratum_quotas(sizes, budget, kept):
+    # Rows of each stratum (color), in proportion to its size and summing exactly to
+    # the budget (largest remainders). Strata with no row kept yet get at least one:
+    # when the budget cannot cover all of them, only the largest ones do and the
+    # smallest strata are left out of the sample
+    minimum = np.zeros(len(sizes), dtype=np.int64)
+    missing = np.flatnonzero(kept == 0)
+    minimum[missing[np.argsort(-sizes[missing], kind="stable")][:budget]] = 1
+
+    rest, weights = budget - minimum.sum(), sizes - minimum
+    shares = rest * weights / weights.sum()
+    quotas = np.floor(shares).astype(np.int64)
+    order = np.argsort(quotas - shares, kind="stable")
+    quotas[order[: rest - quotas.sum()]] += 1
+    return minimum + quotas
+
+
+def sample_rows(df, col_x, col_y, col_color=None, budget=SCATTER_MAX_POINTS, seed=0):
+    # Sample rows so that each color keeps its share, always keeping axis extremes
+    columns = list(dict.fromkeys(col for col in (col_x, col_y, col_color) if col))
+    frame = df[columns].dropna(subset=[col_x, col_y])
+    if len(frame) <= budget:
+        return frame, len(frame)
+
+    values_x = frame[col_x].to_numpy(dtype=float)
+    values_y = frame[col_y].to_numpy(dtype=float)
+    n_extremes = int(budget * EXTREME_SHARE / 4)
+    keep = np.zeros(len(frame), dtype=bool)
+    keep[extreme_rows(values_x, n_extremes)] = True
+    keep[extreme_rows(values_y, n_extremes)] = True
+
+    codes = (
+        pd.factorize(frame[col_color], use_na_sentinel=False)[0]
+        if col_color
+        else np.zeros(len(frame), dtype=np.int64)
+    )
+    sizes = np.bincount(codes)
+    kept = np.bincount(codes[keep], minlength=len(sizes))
+    quotas = stratum_quotas(sizes, budget - int(keep.sum()), kept)
+
+    # Random rank of each row within its color, reproducible thanks to the seed
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(frame)), codes))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    ranks = np.empty(len(frame), dtype=np.int64)
+    ranks[order] = np.arange(len(frame)) - starts[codes[order]]
+    keep |= ranks < quotas[codes]
+    return frame[keep], len(frame)
+
+
+@st.experimental_memo(max_entries=16)
+def cached_sample(_df, fingerprint, col_x, col_y, col_color, budget, seed):
+    # Keyed on the fingerprint of the frame, which is never hashed (leading underscore)
+    return sample_rows(_df, col_x, col_y, col_color, budget, seed)
+
+
+def stratified_sample(
+    df, col_x, col_y, col_color=None, budget=SCATTER_MAX_POINTS, seed=0
+):
+    fingerprint = get_fingerprint(df)
+    return cached_sample(df, fingerprint, col_x, col_y, col_color, budget, seed)
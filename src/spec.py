@@ -0,0 +1,82 @@
+import re
+
+# Keys whose value is a field name, or a list of field names, anywhere in a spec
+KEYS_FIELD = ("field",)
+KEYS_FIELDS = ("fields", "groupby")
+# Keys whose value is a Vega expression that may reference fields through datum
+KEYS_EXPR = ("filter", "calculate", "test", "expr")
+
+# Charts of a group keep their own scales (and legends) for these channels, e.g. a
+# nominal color legend next to a quantitative color heatmap
+RESOLVE_INDEPENDENT = ["color", "size", "opacity", "shape"]
+
+REGEX_DATUM = re.compile(r"datum\.([A-Za-z_$][\w$]*)|datum\[['\"](.+?)['\"]\]")
+
+
+def spec_fields(spec, fields=None):
+    fields = set() if fields is None else fields
+    if isinstance(spec, dict):
+        for key, value in spec.items():
+            if key in KEYS_FIELD and isinstance(value, str):
+                fields.add(value)
+            elif key in KEYS_FIELDS and isinstance(value, list):
+                fields.update(v for v in value if isinstance(v, str))
+            elif key in KEYS_EXPR and isinstance(value, str):
+                fields.update(a or b for a, b in REGEX_DATUM.findall(value))
+            else:
+                spec_fields(value, fields)
+    elif isinstance(spec, list):
+        for value in spec:
+            spec_fields(value, fields)
+    return fields
+
+
+def project(df, spec):
+    # Only serialize the columns referenced by the spec (encoding, transform, params..)
+    fields = spec_fields(spec)
+    fields |= {field.replace("\\.", ".") for field in fields}
+    columns = [col for col in df.columns if col in fields]
+    if not columns or len(columns) == len(df.columns):
+        return df
+    return df[columns]
+
+
+def inline_axis_config(view, config_axis):
+    # Axis config only applies at the top level of a spec, set it on each axis instead
+    encoding = dict(view.get("encoding", {}))
+    for channel in ("x", "y"):
+        if encoding.get(channel):
+            axis = encoding[channel].get("axis", {})
+            encoding[channel] = {**encoding[channel], "axis": {**config_axis, **axis}}
+    return {**view, "encoding": encoding}
+
+
+def concat_specs(charts, titles=(), config_title=None):
+    # Combine (data, spec) charts in one vconcat spec, with one named dataset per frame
+    names, specs, views, config = {}, {}, [], {}
+    for i, (data, spec) in enumerate(charts):
+        name = names.setdefault(id(data), f"dataset_{len(names)}")
+        specs.setdefault(name, (data, []))[1].append(spec)
+
+        view = dict(spec)
+        view_config = view.pop("config", {})
+        config.update({key: value for key, value in view_config.items() if key != "axis"})
+        if view_config.get("axis"):
+            view = inline_axis_config(view, view_config["axis"])
+
+        if i < len(titles):
+            subtitle = view.get("title", {})
+            subtitle = subtitle.get("text") if isinstance(subtitle, dict) else subtitle
+            view["title"] = {
+                "text": titles[i],
+                **(config_title or {}),
+                **({"subtitle": subtitle} if subtitle else {}),
+            }
+        views.append({**view, "data": {"name": name}})
+
+    return {
+        "config": config,
+        "datasets": {name: project(data, group) for name, (data, group) in specs.items()},
+        "vconcat": views,
+        "resolve": {"scale": {channel: "independent" for channel in RESOLVE_INDEPENDENT}},
+    }
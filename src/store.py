@@ -0,0 +1,170 @@
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# Local dataset store: one uncompressed Arrow IPC (Feather v2) file per dataset, so it
+# can be memory-mapped, next to a JSON manifest describing its schema
+STORE_DIR = Path(os.environ.get("VEGA_CHARTS_DATA_DIR", "data"))
+# Never download datasets, only read them from the local store
+OFFLINE = os.environ.get("VEGA_CHARTS_OFFLINE", "0") == "1"
+OPENML_VERSION = 1
+# Prepared datasets, memory-mapped and shared read-only by every session of the server
+SHARED_DIR = STORE_DIR / "shared"
+
+
+def dataset_path(name, store_dir=STORE_DIR):
+    return Path(store_dir) / f"{name}.arrow"
+
+
+def manifest_path(name, store_dir=STORE_DIR):
+    return Path(store_dir) / f"{name}.json"
+
+
+def temp_path(path):
+    # Unique per writer: sessions are threads of one process, and may write the same
+    # dataset at the same time (the last os.replace wins, each file stays whole)
+    return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def read_manifest(name, store_dir=STORE_DIR):
+    path = manifest_path(name, store_dir)
+    return json.loads(path.read_text()) if path.exists() else None
+
+
+def fetch_dataset(name):
+    # Imported here so that offline nodes and warm starts never pay for it
+    from sklearn.datasets import fetch_openml
+
+    df, _ = fetch_openml(
+        name=name,
+        version=OPENML_VERSION,
+        as_frame=True,
+        target_column=None,
+        return_X_y=True,
+    )
+    return df
+
+
+def to_arrow(df):
+    # NaN are kept in float columns instead of becoming nulls, columns without nulls can
+    # be read back as NumPy arrays without any copy
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        dtype = df[field.name].dtype
+        if (
+            table.column(i).null_count
+            and isinstance(dtype, np.dtype)
+            and dtype.kind == "f"
+        ):
+            values = pa.array(df[field.name].to_numpy(), from_pandas=False)
+            table = table.set_column(i, field, values)
+    return table
+
+
+def write_manifest(name, schema, n_rows, store_dir=STORE_DIR, source="openml", **extra):
+    # Written last: its presence means the dataset file is complete
+    manifest = {
+        "name": name,
+        "source": source,
+        **extra,
+        "rows": n_rows,
+        "columns": [{"name": field.name, "type": str(field.type)} for field in schema],
+        "bytes": dataset_path(name, store_dir).stat().st_size,
+        "created": datetime.now(timezone.utc).isoformat(),
+    }
+    path = manifest_path(name, store_dir)
+    path_tmp = temp_path(path)
+    path_tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(path_tmp, path)
+    return manifest
+
+
+def write_dataset(name, df, store_dir=STORE_DIR, source="openml"):
+    path = dataset_path(name, store_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # A single record batch, so that each column is one contiguous buffer in the file
+    table = to_arrow(df)
+    path_tmp = temp_path(path)
+    feather.write_feather(
+        table, path_tmp, compression="uncompressed", chunksize=max(table.num_rows, 1)
+    )
+    os.replace(path_tmp, path)
+    return write_manifest(
+        name, table.schema, table.num_rows, store_dir, source, version=OPENML_VERSION
+    )
+
+
+def read_dataset(name, store_dir=STORE_DIR):
+    # Columns without nulls are read-only views of the memory-mapped file (zero-copy)
+    table = feather.read_table(dataset_path(name, store_dir), memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+class SharedFrame(pd.DataFrame):
+    # Frame shared by every session: adding, replacing or removing columns (and any
+    # inplace=True operation) raises, frames derived from it are plain DataFrames
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def read_only(self, *args, **kwargs):
+        raise TypeError(
+            "Shared datasets are read-only, modify a copy instead (e.g. df.copy())"
+        )
+
+    __setitem__ = __delitem__ = insert = pop = read_only
+    # Methods of pandas that change a frame in place (inplace=True, axis labels..)
+    _update_inplace = _set_axis = read_only
+
+
+def freeze(df):
+    # Arrays are made read-only too (strings, booleans..), so that writing values of a
+    # shared frame in place raises instead of silently changing it for every session
+    for array in df._mgr.arrays:
+        # Extension arrays (categories, datetimes, nullable..) wrap NumPy arrays
+        for attr in ("_ndarray", "_data", "_mask"):
+            values = getattr(array, attr, array)
+            if isinstance(values, np.ndarray):
+                values.flags.writeable = False
+    return SharedFrame(df)
+
+
+def share_dataset(name, df, shared_dir=SHARED_DIR):
+    # Swap a prepared frame for its memory-mapped copy: its pages then belong to the page
+    # cache, paid once for all sessions (and server processes) and reclaimable if needed
+    write_dataset(name, df, shared_dir, source="prepared")
+    return freeze(read_dataset(name, shared_dir))
+
+
+def is_stored(name, store_dir=STORE_DIR):
+    # The manifest is written last, so its presence means the dataset file is complete
+    return (
+        manifest_path(name, store_dir).exists() and dataset_path(name, store_dir).exists()
+    )
+
+
+def load_dataset(name, store_dir=STORE_DIR, offline=OFFLINE):
+    if not is_stored(name, store_dir):
+        if offline:
+            raise FileNotFoundError(
+                f"Dataset '{name}' is not in the local store ({store_dir}) "
+                "and offline mode is enabled."
+            )
+        write_dataset(name, fetch_dataset(name), store_dir)
+    return read_dataset(name, store_dir)
+
+
+if __name__ == "__main__":
+    # Populate the local store, e.g. python -m src.store titanic iris
+    for name in sys.argv[1:]:
+        load_dataset(name, offline=False)
+        print(json.dumps(read_manifest(name), indent=2))
@@ -0,0 +1,126 @@
+import streamlit as st
+
+from src.fingerprint import get_fingerprint
+
+# Date parts recognized in Vega-Lite time units ("dayofyear" must match before "day")
+TIME_PARTS = [
+    "year",
+    "quarter",
+    "month",
+    "week",
+    "dayofyear",
+    "day",
+    "date",
+    "hours",
+    "minutes",
+    "seconds",
+    "milliseconds",
+]
+
+# Units precomputed in a pyramid: every time scale of the app + heatmap combinations
+PYRAMID_UNITS = (
+    "year",
+    "month",
+    "day",
+    "date",
+    "week",
+    "hours",
+    "minutes",
+    "monthyear",
+    "monthdate",
+    "yearmonthdate",
+    "yearmonth",
+    "datehours",
+)
+
+AGGREGATIONS = ["count", "mean", "median", "max", "min"]
+
+
+def field_agg(agg):
+    return f"_{agg}"
+
+
+def unit_parts(*units):
+    parts = set()
+    for unit in units:
+        unit = unit.removeprefix("utc")
+        while unit:
+            part = next((p for p in TIME_PARTS if unit.startswith(p)), None)
+            if part is None:
+                raise ValueError(f"Unknown time unit: {unit}")
+            parts.add(part)
+            unit = unit.removeprefix(part)
+    return [part for part in TIME_PARTS if part in parts]
+
+
+def bucket_unit(*units):
+    # Canonical name of the finest unit covering all given units
+    return "".join(unit_parts(*units))
+
+
+def time_parts(dates):
+    # Vectorized equivalent of vega-time date parts: weeks start on Sunday, days before
+    # the first Sunday of the year are in week 0 (as strftime %U)
+    dt = dates.dt
+    doy = dt.dayofyear
+    weekday = (dt.dayofweek + 1) % 7
+    return {
+        "year": dt.year,
+        "quarter": dt.quarter,
+        "month": dt.month,
+        "week": (doy + 6 - weekday) // 7,
+        "dayofyear": doy,
+        "day": weekday,
+        "date": dt.day,
+        "hours": dt.hour,
+        "minutes": dt.minute,
+        "seconds": dt.second,
+        "milliseconds": dt.microsecond // 1000,
+    }
+
+
+def bucket_frame(df, col_date, units, col_y=None, col_color=None):
+    columns = [col for col in (col_date, col_y, col_color) if col]
+    frame = df[columns].dropna(subset=[col_date])
+    parts = time_parts(frame[col_date])
+    return frame.assign(**{f"_{part}": parts[part] for part in unit_parts(*units)})
+
+
+def bucket_table(frame, unit, col_date, col_y=None, col_color=None):
+    keys = [f"_{part}" for part in unit_parts(unit)]
+    grouped = frame.groupby(
+        keys + ([col_color] if col_color else []),
+        observed=True,
+        dropna=False,
+        sort=False,
+    )
+
+    # Each bucket is represented by its earliest timestamp, which Vega-Lite maps back
+    # to the same bucket when applying the time unit
+    aggs = {col_date: (col_date, "min"), field_agg("count"): (col_date, "size")}
+    if col_y:
+        aggs.update({field_agg(agg): (col_y, agg) for agg in AGGREGATIONS[1:]})
+
+    return grouped.agg(**aggs).reset_index().drop(columns=keys)
+
+
+@st.experimental_memo(max_entries=16)
+def time_pyramid(
+    _df, fingerprint, col_date, col_y=None, col_color=None, units=PYRAMID_UNITS
+):
+    # Keyed on the fingerprint of the frame, which is never hashed (leading underscore)
+    frame = bucket_frame(_df, col_date, units, col_y, col_color)
+    return {
+        bucket_unit(unit): bucket_table(frame, unit, col_date, col_y, col_color)
+        for unit in units
+    }
+
+
+def time_buckets(df, col_date, units, col_y=None, col_color=None):
+    unit = bucket_unit(*units)
+    pyramid = time_pyramid(df, get_fingerprint(df), col_date, col_y, col_color)
+    if unit in pyramid:
+        return pyramid[unit]
+
+    frame = bucket_frame(df, col_date, [unit], col_y, col_color)
+    return bucket_table(frame, unit, col_date, col_y, col_color)
@@ -0,0 +1,190 @@
+import hashlib
+import io
+import os
+import re
+import sys
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.csv as csv
+import pyarrow.parquet as pq
+
+from src.store import STORE_DIR, dataset_path, is_stored, temp_path, write_manifest
+
+# Uploaded datasets, stored apart from OpenML ones and named after their file
+UPLOAD_DIR = STORE_DIR / "uploads"
+UPLOAD_MAX_BYTES = int(os.environ.get("VEGA_CHARTS_UPLOAD_MAX_BYTES", 2 * 2**30))
+UPLOAD_MAX_ROWS = int(os.environ.get("VEGA_CHARTS_UPLOAD_MAX_ROWS", 50_000_000))
+# Memory used by a conversion: CSV files are parsed by blocks of bytes, Parquet files
+# by batches of rows, each one written to the store before reading the next
+UPLOAD_BLOCK_BYTES = 16 * 2**20
+UPLOAD_BATCH_ROWS = 250_000
+# Column types of CSV files are inferred from their first rows, columns with values
+# of another type further in the file are read as strings
+UPLOAD_SAMPLE_BYTES = 2**20
+UPLOAD_TYPES = ["csv", "parquet"]
+# Uploads are identified by their size and the hash of their first and last bytes
+UPLOAD_DIGEST_BYTES = 2**20
+
+
+def upload_name(filename):
+    # The extension is kept, so that uploads never shadow OpenML dataset names
+    return re.sub(r"[^\w.-]+", "_", Path(filename).name)
+
+
+def uploaded_datasets(upload_dir=UPLOAD_DIR):
+    upload_dir = Path(upload_dir)
+    if not upload_dir.is_dir():
+        return []
+    names = [path.name.removesuffix(".json") for path in upload_dir.glob("*.json")]
+    return sorted(name for name in names if is_stored(name, upload_dir))
+
+
+def file_digest(file, size, digest_bytes=UPLOAD_DIGEST_BYTES):
+    # Reads at most 2 blocks, whatever the size of the file
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    digest.update(file.read(digest_bytes))
+    if size > digest_bytes:
+        file.seek(max(size - digest_bytes, digest_bytes))
+        digest.update(file.read(digest_bytes))
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def csv_column_types(file, sample_bytes=UPLOAD_SAMPLE_BYTES):
+    sample = file.read(sample_bytes)
+    file.seek(0)
+    if len(sample) == sample_bytes and b"\n" in sample:
+        sample = sample[: sample.rindex(b"\n") + 1]
+    schema = csv.read_csv(io.BytesIO(sample)).schema
+
+    # Integers are read as floats, so that a missing value further in the file (which
+    # the sample could not see) still fits, empty columns are read as strings
+    column_types = {}
+    for field in schema:
+        if pa.types.is_integer(field.type):
+            column_types[field.name] = pa.float64()
+        elif pa.types.is_null(field.type):
+            column_types[field.name] = pa.string()
+        else:
+            column_types[field.name] = field.type
+    return column_types
+
+
+def csv_error_column(error, column_types):
+    # Column of a conversion error, e.g. "In CSV column #2: Row #90001: CSV conversion
+    # error to double: invalid value 'n/a'" (None for other errors)
+    match = re.match(r"In CSV column #(\d+):", str(error))
+    columns = list(column_types)
+    if match and int(match[1]) < len(columns):
+        return columns[int(match[1])]
+    return None
+
+
+def csv_batches(file, size, column_types):
+    reader = csv.open_csv(
+        file,
+        read_options=csv.ReadOptions(block_size=UPLOAD_BLOCK_BYTES),
+        convert_options=csv.ConvertOptions(column_types=column_types),
+    )
+
+    def batches():
+        for batch in reader:
+            yield batch, file.tell() / size
+
+    return reader.schema, batches()
+
+
+def parquet_batches(file):
+    parquet = pq.ParquetFile(file)
+    n_rows = max(parquet.metadata.num_rows, 1)
+
+    def batches():
+        done = 0
+        for batch in parquet.iter_batches(batch_size=UPLOAD_BATCH_ROWS):
+            done += batch.num_rows
+            yield batch, done / n_rows
+
+    return parquet.schema_arrow, batches()
+
+
+def write_batches(path, schema, batches, filename, max_rows, progress=None):
+    n_rows = 0
+    with pa.ipc.new_file(path, schema) as writer:
+        for batch, done in batches:
+            n_rows += batch.num_rows
+            if n_rows > max_rows:
+                raise ValueError(
+                    f"{filename} has more than {max_rows:,} rows, the upload limit."
+                )
+            writer.write_batch(batch)
+            if progress:
+                progress(min(done, 1.0))
+    return n_rows
+
+
+def write_upload(
+    filename,
+    file,
+    size,
+    upload_dir=UPLOAD_DIR,
+    max_bytes=UPLOAD_MAX_BYTES,
+    max_rows=UPLOAD_MAX_ROWS,
+    progress=None,
+):
+    # Stream a CSV/Parquet file into an Arrow file of the store, one batch at a time
+    if size > max_bytes:
+        raise ValueError(
+            f"{filename} is {size / 1e6:,.0f} MB, the upload limit is "
+            f"{max_bytes / 1e6:,.0f} MB."
+        )
+    name = upload_name(filename)
+    digest = file_digest(file, size)
+    is_parquet = name.lower().endswith(".parquet")
+    column_types = None if is_parquet else csv_column_types(file)
+
+    path = dataset_path(name, upload_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path_tmp = temp_path(path)
+    try:
+        while True:
+            try:
+                if is_parquet:
+                    schema, batches = parquet_batches(file)
+                else:
+                    schema, batches = csv_batches(file, size, column_types)
+                n_rows = write_batches(
+                    path_tmp, schema, batches, filename, max_rows, progress
+                )
+                break
+            except pa.ArrowInvalid as error:
+                # A CSV value that does not fit the type inferred from the first rows
+                # (e.g. "n/a" in a numeric column): that column is read as strings and
+                # the file converted again
+                col = None if is_parquet else csv_error_column(error, column_types)
+                if col is None or column_types[col] == pa.string():
+                    raise
+                column_types[col] = pa.string()
+                file.seek(0)
+        os.replace(path_tmp, path)
+    finally:
+        path_tmp.unlink(missing_ok=True)
+
+    return write_manifest(
+        name,
+        schema,
+        n_rows,
+        upload_dir,
+        "upload",
+        file=filename,
+        file_bytes=size,
+        file_digest=digest,
+    )
+
+
+if __name__ == "__main__":
+    # Add local files to the uploaded datasets, e.g. python -m src.upload sales.csv
+    for path in map(Path, sys.argv[1:]):
+        with path.open("rb") as file:
+            manifest = write_upload(path.name, file, path.stat().st_size)
+        print(f"{manifest['name']}: {manifest['rows']:,} rows")
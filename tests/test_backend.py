@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.backend import DuckDBBackend, PandasBackend
+
+# Optional dependency (poetry install -E parquet)
+pytest.importorskip("duckdb")
+
+
+@pytest.fixture(scope="module")
+def df():
+    # Missing values in every column, skewed values with more outliers than box plots
+    # keep, dates over several new years (week numbers)
+    rng = np.random.default_rng(0)
+    n_rows = 200_000
+    df = pd.DataFrame(
+        {
+            "a": rng.choice(["x", "y", "z", None], n_rows).astype(object),
+            "c": pd.Categorical(rng.choice(["u", "v", "w"], n_rows)),
+            "x": rng.normal(0, 1, n_rows),
+            "y": rng.normal(100, 10, n_rows),
+            "z": rng.lognormal(0, 2, n_rows),
+            "date": pd.Timestamp("2005-12-20")
+            + pd.to_timedelta(rng.integers(0, 12 * 365 * 86_400, n_rows), unit="s"),
+        }
+    )
+    df.loc[::13, "x"] = np.nan
+    df.loc[::17, "y"] = np.nan
+    df.loc[::19, "date"] = pd.NaT
+    return df
+
+
+@pytest.fixture(scope="module")
+def backends(df, tmp_path_factory):
+    path = tmp_path_factory.mktemp("parquet") / "data.parquet"
+    df.to_parquet(path)
+    return PandasBackend(df), DuckDBBackend(path)
+
+
+def normalize(table):
+    # Same dtypes and row order whatever the backend
+    table = table.copy()
+    for col in table.columns:
+        if pd.api.types.is_datetime64_any_dtype(table[col]):
+            table[col] = table[col].astype("datetime64[ns]")
+        elif not pd.api.types.is_numeric_dtype(table[col]):
+            table[col] = table[col].astype(object).where(table[col].notna(), None)
+    return table.sort_values(list(table.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize(
+    "method, args",
+    [
+        ("aggregate_bar", ("a", None, None, "count")),
+        ("aggregate_bar", ("a", "y", "c", "mean")),
+        ("aggregate_bar", ("c", "y", "a", "max", True)),
+        ("aggregate_bar", ("a", None, "a", "count", True)),
+        ("histogram", ("y", None, 20)),
+        ("histogram", ("x", "a", 10, True)),
+        ("histogram_2d", ("x", "y")),
+        ("time_buckets", ("date", ["week"], "y")),
+        ("time_buckets", ("date", ["yearmonthdate"], "y", "c")),
+        ("time_buckets", ("date", ["date", "month"], None, "a")),
+        ("time_buckets", ("date", ["day", "hours"])),
+        ("box_stats", ("a", "z")),
+        ("box_stats", ("c", "z", "a")),
+        ("donut_counts", ("a",)),
+        ("donut_counts", ("a", "c")),
+    ],
+)
+def test_same_results(backends, method, args):
+    pandas_result, duckdb_result = [getattr(b, method)(*args) for b in backends]
+    if isinstance(pandas_result, tuple):
+        # Tables of bins and their steps
+        assert pandas_result[1:] == duckdb_result[1:]
+        pandas_result, duckdb_result = pandas_result[0], duckdb_result[0]
+    assert list(pandas_result.columns) == list(duckdb_result.columns)
+    pd.testing.assert_frame_equal(
+        normalize(pandas_result), normalize(duckdb_result), check_dtype=False
+    )
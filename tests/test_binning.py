@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.binning import FIELD_BIN_X, FIELD_COUNT, histogram, nice_bins, range_edges
+
+
+# [start, stop, step] of the Vega bin transform (nice, default base and divide) for
+# the extent and maxbins
+@pytest.mark.parametrize(
+    "vmin, vmax, maxbins, expected",
+    [
+        (0, 100, 10, (0, 100, 10)),
+        (0.13, 9.7, 10, (0, 10, 1)),
+        (-3.2, 17.9, 20, (-4, 18, 2)),
+        (5, 5, 10, (5, 5.5, 0.5)),
+        (0, 0, 10, (0, 0.1, 0.1)),
+        (-7, -7, 10, (-7, -6, 1)),
+        (0.1, 0.3, 10, (0.1, 0.3, 0.02)),
+        (0.0001, 0.00037, 10, (0.0001, 0.0004, 0.00005)),
+        (1234, 98765, 30, (0, 100_000, 5_000)),
+        (-1e6, 1e6, 7, (-1e6, 1e6, 5e5)),
+        (0.5, 0.51, 100, (0.5, 0.51, 0.0002)),
+        (2, 3, 1, (2, 3, 1)),
+        (0, 1, 3, (0, 1, 0.5)),
+        (-0.5, 12.25, 50, (-0.5, 12.5, 0.5)),
+        (1, 999, 100, (0, 1000, 10)),
+        (-273.15, 1000, 12, (-400, 1000, 200)),
+        (0, 1e9, 10, (0, 1e9, 1e8)),
+        (0.42, 80, 5, (0, 80, 20)),
+    ],
+)
+def test_nice_bins(vmin, vmax, maxbins, expected):
+    start, stop, step, _ = nice_bins(vmin, vmax, maxbins)
+    assert (start, stop, step) == pytest.approx(expected, rel=1e-9, abs=1e-12)
+
+
+def test_range_edges():
+    edges, step, precision = range_edges(0.13, 9.7)
+    np.testing.assert_allclose(edges, np.arange(11))
+    assert (step, precision) == (1, 0)
+    edges, step, precision = range_edges(5, 5)
+    np.testing.assert_allclose(edges, [5, 5.5])
+    assert (step, precision) == (0.5, 1)
+
+
+def test_histogram_counts():
+    # Same counts as numpy on the nice edges, missing values dropped
+    values = np.random.default_rng(0).normal(0, 3, 10_000)
+    values[::7] = np.nan
+    table, step = histogram(pd.DataFrame({"x": values}), "x", maxbins=20)
+    edges, expected_step, _ = range_edges(np.nanmin(values), np.nanmax(values), 20)
+    counts, _ = np.histogram(values[~np.isnan(values)], bins=edges)
+    assert step == expected_step
+    np.testing.assert_allclose(table[FIELD_BIN_X], edges[:-1][counts > 0])
+    np.testing.assert_array_equal(table[FIELD_COUNT], counts[counts > 0])
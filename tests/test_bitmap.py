@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from src.bitmap import BitmapIndex
+
+
+def test_select():
+    rng = np.random.default_rng(0)
+    n_rows = 10_001
+    df = pd.DataFrame(
+        {
+            "a": pd.Categorical(rng.choice(["x", "y", "z", None], n_rows)),
+            "b": rng.integers(0, 5, n_rows),
+        }
+    )
+    index = BitmapIndex(df, ["a", "b"])
+    assert index.values == {"a": ["x", "y", "z"], "b": [0, 1, 2, 3, 4]}
+
+    selection = index.select({"a": ["x", "z"], "b": [1, 3]})
+    expected = np.flatnonzero(df["a"].isin(["x", "z"]) & df["b"].isin([1, 3]))
+    np.testing.assert_array_equal(index.rows(selection), expected)
+    assert index.count(selection) == len(expected)
+    assert index.count(index.select({})) == n_rows
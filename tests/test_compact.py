@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from src.compact import compact
+
+
+def test_compact():
+    dates = pd.Series(pd.date_range("2000-01-01", periods=6, freq="h"))
+    df = pd.DataFrame(
+        {
+            "dates": dates.where(dates.index != 2),
+            "dates_ms": dates + pd.Timedelta(milliseconds=1),
+            "ints": np.arange(6, dtype=np.int64),
+            "floats": np.arange(6) / 2,
+            "floats_64": np.arange(6) / 3,
+            "text": ["a", "b"] * 3,
+            "names": list("abcdef"),
+        }
+    )
+    expected = df.copy()
+    memory = compact(df, cat_cols=["text", "names"])
+    assert memory["after"] < memory["before"]
+
+    assert df["dates"].dtype == "datetime64[s]"
+    assert df["dates_ms"].dtype == "datetime64[ns]"
+    assert df["ints"].dtype == np.int8
+    assert df["floats"].dtype == np.float32
+    assert df["floats_64"].dtype == np.float64
+    assert df["text"].dtype == "category"
+    assert df["names"].dtype == object
+    # Same values, missing dates included
+    pd.testing.assert_frame_equal(df.astype(expected.dtypes.to_dict()), expected)
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.aggregations import aggregate_bar, donut_counts
+from src.cube import DataCube
+
+
+@pytest.fixture
+def df():
+    # Large offsets make sums of squares cancel out, missing values in every column
+    rng = np.random.default_rng(0)
+    n_rows = 50_000
+    df = pd.DataFrame(
+        {
+            "a": pd.Categorical(rng.choice(["x", "y", "z", None], n_rows)),
+            "b": rng.choice(["u", "v", None], n_rows).astype(object),
+            "c": rng.integers(0, 5, n_rows).astype(np.int8),
+            "small": rng.normal(0, 1, n_rows),
+            "large": rng.normal(1e8, 1, n_rows),
+        }
+    )
+    df.loc[::17, "small"] = np.nan
+    df.loc[::23, "large"] = np.nan
+    return df
+
+
+@pytest.fixture
+def cube(df):
+    return DataCube(df, ["a", "b", "c"], ["small", "large"])
+
+
+@pytest.mark.parametrize("agg", ["count", "sum", "mean", "var", "std"])
+@pytest.mark.parametrize("col_y", ["small", "large"])
+@pytest.mark.parametrize(
+    "col_x, col_color", [("a", None), ("b", "c"), ("c", "a"), ("a", "a")]
+)
+@pytest.mark.parametrize("norm", [False, True])
+def test_aggregate_bar(df, cube, col_x, col_y, col_color, agg, norm):
+    assert cube.covers(list(dict.fromkeys(col for col in (col_x, col_color) if col)))
+    expected = aggregate_bar(df, col_x, col_y, col_color, agg, norm)
+    result = cube.aggregate_bar(col_x, col_y, col_color, agg, norm)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, rtol=1e-6)
+
+
+@pytest.mark.parametrize(
+    "col_color_1, col_color_2", [("a", None), ("a", "b"), ("c", "c")]
+)
+def test_donut_counts(df, cube, col_color_1, col_color_2):
+    expected = donut_counts(df, col_color_1, col_color_2)
+    result = cube.donut_counts(col_color_1, col_color_2)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_covers(cube):
+    assert not cube.covers(["a", "other"])
+    assert not cube.covers(["a"], "other", "mean")
+    assert not cube.covers(["a"], "small", "median")
+
+
+@pytest.mark.parametrize(
+    "filters", [{"a": ["x"]}, {"a": ["x", "z"], "c": [1, 2]}, {"b": ["v"], "c": [4]}]
+)
+def test_select(df, cube, filters):
+    mask = np.logical_and.reduce(
+        [df[col].isin(values) for col, values in filters.items()]
+    )
+    selected = cube.select(filters)
+    assert cube.covers_filters(filters) and len(selected) < len(cube)
+    for agg, col_y in [("count", None), ("mean", "small"), ("std", "large")]:
+        expected = aggregate_bar(df[mask], "a", col_y, "b", agg)
+        result = selected.aggregate_bar("a", col_y, "b", agg)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False, rtol=1e-6)
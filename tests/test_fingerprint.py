@@ -0,0 +1,29 @@
+import gc
+
+import numpy as np
+import pandas as pd
+
+from src.fingerprint import FINGERPRINTS, attach_fingerprint, fingerprint, get_fingerprint
+
+
+def test_derived_frames():
+    df = pd.DataFrame({"a": np.arange(10), "b": np.arange(10) % 3})
+    value = attach_fingerprint(df, source="manifest")
+    assert get_fingerprint(df) == value
+
+    # Derived frames do not inherit the fingerprint of df, even with its attrs
+    df.attrs["name"] = "dataset"
+    for derived in [df.copy(), df[["a"]], df[df["b"] == 1]]:
+        assert get_fingerprint(derived) == fingerprint(derived)
+        assert get_fingerprint(derived) != value
+
+
+def test_collected_frames():
+    # Fingerprints go with their frame, so a recycled id never finds a stale one
+    df = pd.DataFrame({"a": np.arange(10)})
+    key = id(df)
+    attach_fingerprint(df, source="manifest")
+    assert key in FINGERPRINTS
+    del df
+    gc.collect()
+    assert key not in FINGERPRINTS
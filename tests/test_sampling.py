@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.sampling import sample_rows, stratum_quotas
+
+
+@pytest.fixture
+def df():
+    # Skewed colors: a few large ones and many with a handful of rows
+    rng = np.random.default_rng(0)
+    n_rows = 100_000
+    colors = np.where(
+        rng.random(n_rows) < 0.9,
+        rng.integers(0, 3, n_rows),
+        rng.integers(3, 203, n_rows),
+    )
+    return pd.DataFrame(
+        {
+            "x": rng.normal(0, 1, n_rows),
+            "y": rng.exponential(1, n_rows),
+            "color": colors.astype(str),
+        }
+    )
+
+
+@pytest.mark.parametrize("budget", [100, 1_000, 5_000, 20_000])
+@pytest.mark.parametrize("col_color", [None, "color"])
+def test_sample_budget(df, budget, col_color):
+    sample, n_total = sample_rows(df, "x", "y", col_color, budget)
+    assert n_total == len(df)
+    assert len(sample) <= budget
+    assert len(sample) >= budget * 0.95
+    assert sample.index.is_unique
+    # Extremes of both axes are always kept
+    for col in ["x", "y"]:
+        assert sample[col].min() == df[col].min()
+        assert sample[col].max() == df[col].max()
+
+
+def test_sample_strata(df):
+    # Budget above the number of colors: every one is represented, large ones keep
+    # their share
+    sample, _ = sample_rows(df, "x", "y", "color", 5_000)
+    assert set(sample["color"]) == set(df["color"])
+    shares = sample["color"].value_counts() / len(sample)
+    expected = df["color"].value_counts() / len(df)
+    np.testing.assert_allclose(shares[["0", "1", "2"]], expected[["0", "1", "2"]], 0.1)
+
+
+def test_sample_small_budget(df):
+    # Fewer points than colors: the largest ones are still represented
+    sample, _ = sample_rows(df, "x", "y", "color", 100)
+    assert len(sample) <= 100
+    assert {"0", "1", "2"} <= set(sample["color"])
+
+
+def test_sample_seed(df):
+    first, _ = sample_rows(df, "x", "y", "color", 1_000, seed=1)
+    second, _ = sample_rows(df, "x", "y", "color", 1_000, seed=1)
+    pd.testing.assert_frame_equal(first, second)
+
+
+@pytest.mark.parametrize("budget", [0, 1, 3, 10, 99, 1_000])
+def test_stratum_quotas(budget):
+    sizes = np.array([5_000, 300, 1, 1, 2, 20])
+    kept = np.array([0, 0, 0, 1, 0, 0])
+    quotas = stratum_quotas(sizes, budget, kept)
+    assert quotas.sum() == budget
+    assert (quotas <= sizes).all()
+    if budget >= (kept == 0).sum():
+        assert ((quotas + kept) > 0).all()
+    # Strata only dropped when the budget is too small, smallest first
+    assert (np.diff((quotas[[0, 1, 5, 4]] > 0).astype(int)) <= 0).all()
@@ -0,0 +1,79 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+from src.timebuckets import time_parts
+
+
+def utc_parts(timestamp):
+    # Date parts of the instant Vega-Lite reads from a naive timestamp (sent as UTC),
+    # as vega-time utc units compute them: utcweek is strftime %U, utcday is %w
+    date = datetime.fromtimestamp(timestamp.value / 1e9, timezone.utc)
+    return {
+        "year": date.year,
+        "quarter": (date.month - 1) // 3 + 1,
+        "month": date.month,
+        "week": int(date.strftime("%U")),
+        "dayofyear": date.timetuple().tm_yday,
+        "day": int(date.strftime("%w")),
+        "date": date.day,
+        "hours": date.hour,
+        "minutes": date.minute,
+        "seconds": date.second,
+        "milliseconds": date.microsecond // 1000,
+    }
+
+
+def assert_parts(dates):
+    parts = time_parts(pd.Series(dates))
+    for i, timestamp in enumerate(dates):
+        assert {part: int(values[i]) for part, values in parts.items()} == utc_parts(
+            timestamp
+        ), timestamp
+
+
+def test_year_boundaries():
+    # Two weeks around every new year, whatever day of the week it starts on
+    dates = [
+        day
+        for year in range(1990, 2031)
+        for day in pd.date_range(f"{year - 1}-12-24", f"{year}-01-07")
+    ]
+    assert_parts(dates)
+
+
+@pytest.mark.parametrize(
+    "date, week",
+    [
+        ("2006-01-01", 1),  # Sunday
+        ("2011-12-31", 52),
+        ("2012-01-01", 1),  # Sunday
+        ("2012-12-31", 53),
+        ("2017-01-01", 1),  # Sunday
+        ("2017-12-31", 53),
+        ("2021-01-01", 0),  # Friday, before the first Sunday
+        ("2021-01-03", 1),
+    ],
+)
+def test_week(date, week):
+    assert time_parts(pd.Series([pd.Timestamp(date)]))["week"][0] == week
+
+
+def test_dst_boundaries():
+    # Naive timestamps have no DST: the hours skipped or repeated by local clocks (here
+    # in Europe and the US) keep their own parts
+    dates = [
+        pd.Timestamp(date)
+        for date in [
+            "2021-03-28 01:59:59.999",
+            "2021-03-28 02:30",
+            "2021-03-28 03:00",
+            "2021-10-31 02:30",
+            "2021-03-14 02:30",
+            "2021-11-07 01:30",
+            "2020-12-31 23:59:59.999",
+            "2021-01-01",
+        ]
+    ]
+    assert_parts(dates)